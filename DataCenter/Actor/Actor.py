@@ -1,6 +1,7 @@
 import logging
-from bson import ObjectId
+from pymongo import UpdateOne
 from metaphone import doublemetaphone
+from fuzzywuzzy import fuzz
 from DataCenter.Actor.ActorConnection import ActorConnection
 
 class Actor():
@@ -11,15 +12,19 @@ class Actor():
   TODO: Add actor location
   '''
   _collectionKey='actor'
+  _bucketCollectionKey = 'actor_bucket'
+  _MATCH_THRESHOLD = 85
+  # most recent articles kept on the actor and on each of its buckets
+  _SAMPLE_SIZE = 50
 
-  def __init__(self, actorType, name, locationID=None, articleIDs=[], connections={}, id=None, db=None, **kwds):
+  def __init__(self, actorType, name, locationID=None, articleIDs=[], connections={}, id=None, db=None, writer=None, **kwds):
     '''
     Initializes an Actor object.
+    If a BulkWriter is given, the insert of a new actor is queued.
     '''
     self.actorType = actorType
     self.name = name
-    metaphone_name = doublemetaphone(name)
-    self._a_name = metaphone_name[0] + metaphone_name[1]
+    self._a_keys = Actor.phoneticKeys(name)
     self.locationID = locationID
     self.articleIDs = articleIDs
 
@@ -30,11 +35,84 @@ class Actor():
       self._db = db
       self._collection = db[Actor._collectionKey]
       if not id:
-        self.storeDB(db)
+        self.storeDB(db, writer)
       else:
         self._mongoID = id
         self._id = str(id)
 
+  @staticmethod
+  def phoneticKeys(name):
+    '''
+    Returns the primary and secondary DoubleMetaphone codes
+    used to find candidate matches for an actor name, or its
+    normalized (lowercase) name if it has no code, e.g. non-Latin names
+    '''
+    primary, secondary = doublemetaphone(name)
+    if not primary: return [' '.join(name.lower().split())]
+    if not secondary or secondary == primary: return [primary]
+    return [primary, secondary]
+
+  @staticmethod
+  def migrate(db, batchSize=1000):
+    '''
+    Sets the codes of the actors stored before them (with only _a_name).
+    Returns the number of actors migrated.
+    '''
+    collection = db[Actor._collectionKey]
+    operations = []
+    migrated = 0
+    for actor in collection.find({'_a_keys': {'$exists': False}}, {'name': 1}):
+      operations.append(UpdateOne({'_id': actor['_id']}, {
+        '$set': {'_a_keys': Actor.phoneticKeys(actor.get('name') or '')},
+        '$unset': {'_a_name': ''}
+      }))
+      if len(operations) >= batchSize:
+        collection.bulk_write(operations)
+        migrated += len(operations)
+        operations = []
+    if operations:
+      collection.bulk_write(operations)
+      migrated += len(operations)
+    if migrated: logging.info(f'Actor.migrate: {migrated} actors migrated')
+    return migrated
+
+  @staticmethod
+  def bestMatch(name, candidates, threshold=None):
+    '''
+    Ranks candidates, an iterable of (actorID, actorName), by fuzzy score
+    against name. Returns the actorID of the best candidate scoring at least
+    threshold, None otherwise.
+    '''
+    threshold = Actor._MATCH_THRESHOLD if threshold is None else threshold
+    bestID, bestScore = None, threshold - 1
+    for actorID, candidateName in candidates:
+      score = fuzz.token_set_ratio(name.lower(), candidateName.lower())
+      if score > bestScore:
+        bestID, bestScore = actorID, score
+    return bestID
+
+  @staticmethod
+  def articleOperation(actorID, articleIDs):
+    '''
+    Returns the update (an UpdateOne) adding articleIDs to an actor:
+    its article count, and its most recent articles
+    '''
+    return UpdateOne({'_id': actorID}, {
+      '$push': {'articleIDs': {'$each': articleIDs[-Actor._SAMPLE_SIZE:], '$slice': -Actor._SAMPLE_SIZE}},
+      '$inc': {'articleCount': len(articleIDs)}
+    })
+
+  @staticmethod
+  def bucketOperation(actorID, day, articleIDs):
+    '''
+    Returns the upsert (an UpdateOne) adding articleIDs to the
+    bucket of an actor for day (YYYYMMDD)
+    '''
+    return UpdateOne({'actorID': actorID, 'day': day}, {
+      '$push': {'articleIDs': {'$each': articleIDs[-Actor._SAMPLE_SIZE:], '$slice': -Actor._SAMPLE_SIZE}},
+      '$inc': {'strength': len(articleIDs)}
+    }, upsert=True)
+
   def addArticle(self, articleID):
     '''
     Adds an article to the Actor oject
@@ -48,13 +126,18 @@ class Actor():
     to the existing connection
 
     If the connection doesn't exist, creates a new one.
+    Either way, this is a single upsert on the canonical actor pair.
     '''
     logging.log(3, 'Actor.updateOrCreateConnection: updating or creating connection')
-    if actor._id in self.connections:
-      success = self.updateConnection(actor, articleID)
-    else:
-      success = self.createConnection(actor, articleID)
-    return success
+    connectionID = ActorConnection.addArticles(self._db, self._mongoID, actor._mongoID, [articleID])
+    if connectionID is False: return False
+    if connectionID is None: return True
+
+    # link the new connection from both actors
+    self.connections[actor._id] = connectionID
+    if not self.createOneDirectionConnection(self._mongoID, actor._mongoID, connectionID): return False
+    if not self.createOneDirectionConnection(actor._mongoID, self._mongoID, connectionID): return False
+    return True
 
   def createConnection(self, actor, articleID):
     '''
@@ -65,14 +148,7 @@ class Actor():
     if actor._id in self.connections:
       logging.error('Actor.createConnection: Connection already exists')
       return False
-
-    connectionID = ActorConnection([self._mongoID, actor._mongoID], [articleID], db=self._db)._mongoID
-
-    # push connection
-    if not self.createOneDirectionConnection(self._mongoID, actor._mongoID, connectionID): return False
-    if not self.createOneDirectionConnection(actor._mongoID, self._mongoID, connectionID): return False
-
-    return True
+    return self.updateOrCreateConnection(actor, articleID)
 
   def createOneDirectionConnection(self, primaryID, secondaryID, connectionID):
     '''
@@ -95,25 +171,19 @@ class Actor():
     if actor._id not in self.connections:
       logging.error('Actor.updateConnection: Connection does not exist')
       return False
-    query = {'_id': ObjectId(self.connections[actor._mongoID])}
-    collectionObj = self._collection.find_one(query)
-    if not collectionObj:
-      logging.error('Actor.updateConnection: Connection not in database')
-      return False
-    collectionObj['_db'] = self._db
-    connection = ActorConnection.fromDB(collectionObj)
-    if not connection.updateConnection(articleID): return False
-    return True
+    return ActorConnection.addArticles(self._db, self._mongoID, actor._mongoID, [articleID]) is not False
 
-  def storeDB(self, db):
+  def storeDB(self, db, writer=None):
     '''
     Stores in database. If the ID already exists, updates the existing entry.
     '''
     if not db:
       logging.error('Actor.storeDB: No DB provided')
       return False
-    encoding = self._serialize()
-    self._mongoID = self._collection.insert_one(self._serialize()).inserted_id
+    if writer:
+      self._mongoID = writer.insert(Actor._collectionKey, self._serialize())
+    else:
+      self._mongoID = self._collection.insert_one(self._serialize()).inserted_id
     self._id = str(self._mongoID)
 
     return self._id
@@ -124,10 +194,11 @@ class Actor():
     '''
     return {
       'name': self.name,
-      '_a_name': self._a_name,
+      '_a_keys': self._a_keys,
       'actorType': self.actorType,
       'locationID': self.locationID,
-      'articleIDs': self.articleIDs,
+      'articleIDs': self.articleIDs[-Actor._SAMPLE_SIZE:],
+      'articleCount': len(self.articleIDs),
       'connections': self.connections
     }
 
@@ -0,0 +1,58 @@
+import logging
+
+from DataCenter.Actor.Actor import Actor
+from DataCenter.Utils.lru import LRUCache
+
+class ActorCache(LRUCache):
+  '''
+  Defines the ActorCache, which resolves actor names to
+  their ObjectId without querying MongoDB.
+
+  Entries are keyed by (DoubleMetaphone code, actor type), and hold the
+  {actorID: name} candidates sharing that code, which are ranked by
+  fuzzy score on lookup. The cache is warmed from the actor collection,
+  and must be told about every new actor (see add) to stay coherent.
+  '''
+
+  def warm(self, db):
+    '''
+    Loads up to maxSize actors from the actor collection.
+    Returns the number of cached codes.
+    '''
+    cursor = db[Actor._collectionKey].find({}, {'name': 1, 'actorType': 1, '_a_keys': 1})
+    for actor in cursor.limit(self.maxSize):
+      self._addCandidate(actor['actorType'], actor.get('_a_keys', []), actor['_id'], actor['name'])
+    logging.info(f'ActorCache.warm: {len(self)} actor codes cached')
+    return len(self)
+
+  def lookup(self, actorType, actorName, codes=None):
+    '''
+    Returns the ObjectId of the best matching cached actor,
+    None if no cached actor matches. codes are the DoubleMetaphone
+    codes of actorName, if already computed.
+    '''
+    candidates = {}
+    for code in codes or Actor.phoneticKeys(actorName):
+      candidates.update(self.peek((code, actorType), {}))
+    actorID = Actor.bestMatch(actorName, candidates.items())
+    if actorID: self.hits += 1
+    else: self.misses += 1
+    return actorID
+
+  def add(self, actorType, actorName, actorID, codes=None):
+    '''
+    Caches a resolved or newly created actor
+    '''
+    self._addCandidate(actorType, codes or Actor.phoneticKeys(actorName), actorID, actorName)
+
+  def _addCandidate(self, actorType, codes, actorID, actorName):
+    '''
+    Adds the actor to the candidates of each of its codes
+    '''
+    for code in codes:
+      key = (code, actorType)
+      candidates = self.peek(key)
+      if candidates is None:
+        candidates = {}
+        self.put(key, candidates)
+      candidates[actorID] = actorName
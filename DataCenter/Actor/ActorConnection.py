@@ -1,5 +1,6 @@
 import logging
 from bson.objectid import ObjectId
+from pymongo import UpdateOne, DeleteOne
 
 class ActorConnection():
   '''
@@ -7,9 +8,19 @@ class ActorConnection():
   An Actor Connection is (usually) tied to an article
   and a 'strength'. It will have a sentiment attached as well.
 
+  A connection is identified by its canonical actor pair
+  (actorA, actorB) = (min, max) of its actorIDs, which is
+  unique in the collection.
+
+  The connection document keeps the total strength and the most recent
+  articles (at most _SAMPLE_SIZE). Daily strengths and article samples
+  are kept in bucket documents, one per pair and day.
+
   TODO: Implement sentiment in connection
   '''
   _collectionKey = 'actor_connection'
+  _bucketCollectionKey = 'actor_connection_bucket'
+  _SAMPLE_SIZE = 50
 
   def __init__(self, actorIDs, articleIDs=None, sentiment=None, id=None, db=None):
     '''
@@ -17,8 +28,9 @@ class ActorConnection():
     '''
 
     self.actorIDs = actorIDs
+    (self.actorA, self.actorB) = ActorConnection.canonicalPair(*actorIDs)
     self.strength = len(articleIDs)
-    self.articleIDs = articleIDs
+    self.articleIDs = articleIDs[-ActorConnection._SAMPLE_SIZE:]
     self.sentiment = sentiment
 
     if db:
@@ -30,6 +42,102 @@ class ActorConnection():
         self._mongoID = id
         self._id = str(id)
 
+  @staticmethod
+  def canonicalPair(actorID1, actorID2):
+    '''
+    Returns the actor pair (min, max) identifying a connection
+    '''
+    return (actorID1, actorID2) if actorID1 <= actorID2 else (actorID2, actorID1)
+
+  @staticmethod
+  def upsertOperation(actorID1, actorID2, articleIDs):
+    '''
+    Returns the atomic upsert (an UpdateOne) adding articleIDs to the
+    connection between two actors, creating it if it doesn't exist
+    '''
+    return UpdateOne(*ActorConnection._upsert(actorID1, actorID2, articleIDs), upsert=True)
+
+  @staticmethod
+  def _upsert(actorID1, actorID2, articleIDs):
+    '''
+    Returns the query and update of upsertOperation
+    '''
+    actorA, actorB = ActorConnection.canonicalPair(actorID1, actorID2)
+    return {'actorA': actorA, 'actorB': actorB}, {
+      '$setOnInsert': {'actorIDs': [actorA, actorB], 'sentiment': None},
+      '$push': {'articleIDs': ActorConnection._sample(articleIDs)},
+      '$inc': {'strength': len(articleIDs)}
+    }
+
+  @staticmethod
+  def bucketOperation(actorID1, actorID2, day, articleIDs):
+    '''
+    Returns the upsert (an UpdateOne) adding articleIDs to the
+    bucket of the connection between two actors for day (YYYYMMDD)
+    '''
+    actorA, actorB = ActorConnection.canonicalPair(actorID1, actorID2)
+    return UpdateOne({'actorA': actorA, 'actorB': actorB, 'day': day}, {
+      '$push': {'articleIDs': ActorConnection._sample(articleIDs)},
+      '$inc': {'strength': len(articleIDs)}
+    }, upsert=True)
+
+  @staticmethod
+  def _sample(articleIDs):
+    '''
+    Returns the $push modifier keeping the _SAMPLE_SIZE most recent articles
+    '''
+    return {'$each': articleIDs[-ActorConnection._SAMPLE_SIZE:], '$slice': -ActorConnection._SAMPLE_SIZE}
+
+  @staticmethod
+  def addArticles(db, actorID1, actorID2, articleIDs):
+    '''
+    Adds articleIDs to the connection between two actors with a single
+    indexed write. Returns the ObjectId of the connection if it was
+    created, None if it existed, and False if the write failed.
+    '''
+    query, update = ActorConnection._upsert(actorID1, actorID2, articleIDs)
+    result = db[ActorConnection._collectionKey].update_one(query, update, upsert=True)
+    if not result.acknowledged:
+      logging.error('DB: addArticles not acknowledged')
+      return False
+    return result.upserted_id
+
+  @staticmethod
+  def migrate(db, batchSize=1000):
+    '''
+    Sets the canonical actor pair of the connections stored before it
+    (with only actorIDs), merging the connections of a same pair.
+    Returns the number of connections migrated.
+    '''
+    collection = db[ActorConnection._collectionKey]
+    legacy = list(collection.find({'actorA': {'$exists': False}}, {'actorIDs': 1, 'articleIDs': 1, 'strength': 1}))
+    migrated = 0
+    for start in range(0, len(legacy), batchSize):
+      batch = [doc for doc in legacy[start:start+batchSize] if len(set(doc.get('actorIDs') or [])) == 2]
+      pairs = {ActorConnection.canonicalPair(*doc['actorIDs']): None for doc in batch}
+      if not pairs: continue
+      # the connections of these pairs already migrated or stored
+      for doc in collection.find({'$or': [{'actorA': a, 'actorB': b} for a, b in pairs]}, {'actorA': 1, 'actorB': 1}):
+        pairs[(doc['actorA'], doc['actorB'])] = doc['_id']
+
+      operations = []
+      for doc in batch:
+        pair = ActorConnection.canonicalPair(*doc['actorIDs'])
+        articleIDs = doc.get('articleIDs') or []
+        if pairs[pair] is None:
+          pairs[pair] = doc['_id']
+          operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'actorA': pair[0], 'actorB': pair[1]}}))
+        else:
+          operations.append(UpdateOne({'_id': pairs[pair]}, {
+            '$push': {'articleIDs': ActorConnection._sample(articleIDs)},
+            '$inc': {'strength': doc.get('strength', len(articleIDs))}
+          }))
+          operations.append(DeleteOne({'_id': doc['_id']}))
+      collection.bulk_write(operations)
+      migrated += len(batch)
+    if migrated: logging.info(f'ActorConnection.migrate: {migrated} connections migrated')
+    return migrated
+
   def updateConnection(self, articleID):
     '''
     Updates the connection with the new article
@@ -38,7 +146,7 @@ class ActorConnection():
     query = {'_id': self._mongoID}
     result = self._collection.update_one(query, {
       '$set': {'sentiment': self.sentiment},
-      '$push': {'articleIDs': articleID},
+      '$push': {'articleIDs': ActorConnection._sample([articleID])},
       '$inc': {'strength': 1}
     })
     if not result.acknowledged:
@@ -69,6 +177,8 @@ class ActorConnection():
     '''
     return {
       'actorIDs': self.actorIDs,
+      'actorA': self.actorA,
+      'actorB': self.actorB,
       'strength': self.strength,
       'articleIDs': self.articleIDs,
       'sentiment': self.sentiment
@@ -1,5 +1,9 @@
 import logging
-from sumy.parsers.html import HtmlParser
+import hashlib
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from pymongo.errors import DuplicateKeyError
+from sumy.parsers.plaintext import PlaintextParser
 from sumy.nlp.tokenizers import Tokenizer
 from sumy.summarizers.lsa import LsaSummarizer as Summarizer
 from sumy.nlp.stemmers import Stemmer
@@ -8,7 +12,7 @@ from pycountry import languages
 from langdetect import detect
 from rake_nltk import Rake
 
-from DataCenter.Utils.parse import extractText
+from DataCenter.Utils.parse import fetchHTML, parseDocument, extractTextFromDocument, extractParagraphs
 
 class Article():
   '''
@@ -18,22 +22,35 @@ class Article():
   '''
   _collectionKey = 'article'
   _SENTENCE_COUNT = 4
+  # query parameters which don't identify the article
+  _TRACKING_PARAMETERS = ('utm_', 'fbclid', 'gclid', 'ocid', 'cmpid')
 
   def __init__(self, url, date, actorIDs=[], peopleIDs=[],
                orgIDs=[], locationIDs=[], language=None,
-               keywords=None, summary=None, id=None, db=None, **kwds):
+               keywords=None, summary=None, id=None, db=None, writer=None, parse=True, **kwds):
     '''
     Initializes an Article class from a url.
+    If a BulkWriter is given, the insert of a new article is queued.
+    If parse is False, the article is stored without its language, keywords
+    and summary, to be enriched later (see ArticleEnricher).
     '''
     self.date = date
     self.url = url
+    self.urlHash = Article.hashURL(url)
+    # False if the article was already stored (see storeDB)
+    self.inserted = True
     self.actorIDs = actorIDs
     self.peopleIDs = peopleIDs
     self.orgIDs = orgIDs
     self.locationIDs = locationIDs
+    self.enriched = True
     if not (language and keywords and summary):
-      parse = self._parse_url(url)
-      if parse: (self.language, self.keywords, self.summary) = parse
+      (self.language, self.keywords, self.summary) = (language, keywords, summary)
+      if parse:
+        parsed = self._parse_url(url)
+        if parsed: (self.language, self.keywords, self.summary) = parsed
+      else:
+        self.enriched = False
     else:
       self.language = language
       self.keywords = keywords
@@ -43,7 +60,7 @@ class Article():
       self._db = db
       self._collection = db[Article._collectionKey]
       if not id:
-        self.storeDB(db)
+        self.storeDB(db, writer)
       else:
         self._mongoID = id
         self._id = str(id)
@@ -53,17 +70,29 @@ class Article():
     Takes in a url, and returns its language, keywords, and summary
     '''
     try:
-      text = extractText(url)
+      return Article.parseHTML(fetchHTML(url), url)
+    except Exception as e:
+      logging.error(e)
+      return False
+
+  @staticmethod
+  def parseHTML(html, url):
+    '''
+    Takes in the page of an article, and returns its language, keywords, and summary.
+    The page is parsed once, and its paragraphs are summarized.
+    '''
+    try:
+      document = parseDocument(html)
+      text = extractTextFromDocument(document)
       language = languages.get(alpha_2=detect(text)).name
-      parser = HtmlParser.from_url(url, Tokenizer(language))
-      stemmer = Stemmer(language)
-      summarizer = Summarizer(stemmer)
-      summarizer.stop_words = get_stop_words(language)
+      (tokenizer, summarizer, r) = Article._languageTools(language)
+
+      paragraphs = extractParagraphs(document)
+      parser = PlaintextParser.from_string('\n\n'.join(paragraphs) if paragraphs else text, tokenizer)
       summary = ''
       for sentence in summarizer(parser.document, Article._SENTENCE_COUNT):
         summary += str(sentence)
 
-      r = Rake(language, max_length=3)
       r.extract_keywords_from_text(text)
       keywords = r.get_ranked_phrases()[:10]
 
@@ -73,23 +102,82 @@ class Article():
       logging.error(e)
       return False
 
-  def storeDB(self, db):
+  @staticmethod
+  def normalizeURL(url):
+    '''
+    Returns the normalized url: lowercased scheme and host without
+    www. and default port, no fragment, no trailing slash, and sorted
+    query parameters without tracking parameters.
+    Malformed urls (e.g. invalid port or IPv6 host) are only stripped.
+    '''
+    try:
+      parts = urlsplit(url.strip())
+      port = parts.port
+    except ValueError:
+      return url.strip()
+    scheme = parts.scheme.lower() or 'http'
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'): host = host[4:]
+    if port and port not in (80, 443): host = f'{host}:{port}'
+    path = parts.path.rstrip('/') or '/'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith(Article._TRACKING_PARAMETERS))
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+  @staticmethod
+  def hashURL(url):
+    '''
+    Returns the hash identifying the article at url
+    '''
+    return hashlib.sha1(Article.normalizeURL(url).encode('utf-8')).hexdigest()
+
+  @staticmethod
+  @lru_cache(maxsize=None)
+  def _languageTools(language):
+    '''
+    Returns the tokenizer, summarizer and keyword extractor of a
+    language, built once per language and process
+    '''
+    summarizer = Summarizer(Stemmer(language))
+    summarizer.stop_words = get_stop_words(language)
+    return Tokenizer(language), summarizer, Rake(language, max_length=3)
+
+  def storeDB(self, db, writer=None):
     '''
-    Stores in database
+    Stores in database, unless an article with the same urlHash is
+    already stored. If a BulkWriter is given, the upsert is queued.
     '''
     if not db:
       logging.error('No DB provided')
       return False
-    self._mongoID = self._collection.insert_one(self._serialize()).inserted_id
+    if writer:
+      self._mongoID = writer.upsert(Article._collectionKey, {'urlHash': self.urlHash}, self._serialize())
+    else:
+      self._mongoID = self._upsert(db[Article._collectionKey])
     self._id = str(self._mongoID)
     return self._mongoID
 
+  def _upsert(self, collection):
+    '''
+    Upserts the article on its urlHash. Returns its ObjectId.
+    '''
+    query = {'urlHash': self.urlHash}
+    try:
+      result = collection.update_one(query, {'$setOnInsert': self._serialize()}, upsert=True)
+      if result.upserted_id is not None: return result.upserted_id
+    except DuplicateKeyError:
+      # inserted concurrently, by another ingestion process
+      pass
+    self.inserted = False
+    return collection.find_one(query, {'_id': 1})['_id']
+
   def _serialize(self):
     '''
     Serializes the Article class
     '''
     return {
       'url': self.url,
+      'urlHash': self.urlHash,
       'date': self.date,
       'actorIDs': self.actorIDs,
       'peopleIDs': self.peopleIDs,
@@ -98,6 +186,7 @@ class Article():
       'language': self.language,
       'keywords': self.keywords,
       'summary': self.summary,
+      'enriched': self.enriched,
     }
 
   @classmethod
@@ -0,0 +1,182 @@
+import socket
+import asyncio
+import logging
+import threading
+from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import urllib3
+
+from DataCenter.Article.Article import Article
+from DataCenter.Utils import parse
+from DataCenter.Utils.httpclient import HTTPClient
+
+def analyzeHTML(html, url):
+  '''
+  Runs on the NLP worker processes. Returns the language,
+  keywords and summary of the page, or False.
+  '''
+  return Article.parseHTML(html, url)
+
+class ArticleEnricher():
+  '''
+  Defines an ArticleEnricher, which fills in the language, keywords
+  and summary of stored articles off the ingestion path.
+
+  Articles are queued with submit. An asyncio event loop, on a
+  background thread, runs fetchWorkers concurrent fetches (at most
+  hostLimit per host, with a timeout and retries), and hands the
+  pages to a pool of nlpWorkers processes for language detection,
+  summarization and keyword extraction.
+  '''
+
+  def __init__(self, db, fetchWorkers=16, nlpWorkers=None, hostLimit=2,
+               timeout=10, retries=2, backoff=1.0, client=None):
+    '''
+    Initializes the ArticleEnricher and starts its event loop.
+    nlpWorkers defaults to the number of CPUs. Failed fetches are
+    retried retries times, after backoff, 2*backoff, ... seconds.
+    Pages are fetched through client (an HTTPClient, by default
+    pooled without cache).
+    '''
+    self._db = db
+    self.client = client or HTTPClient(maxConnections=hostLimit)
+    self.fetchWorkers = fetchWorkers
+    self.hostLimit = hostLimit
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+
+    self.enriched = 0
+    self.failed = 0
+
+    # articleIDs queued and not done yet
+    self._queued = set()
+    self._idle = threading.Condition()
+
+    self._pool = ProcessPoolExecutor(nlpWorkers)
+    self._loop = asyncio.new_event_loop()
+    self._loop.set_default_executor(ThreadPoolExecutor(fetchWorkers))
+    self._ready = threading.Event()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+    self._ready.wait()
+
+  def submit(self, articleID, url):
+    '''
+    Queues an article for enrichment. Returns False if it is already queued.
+    Safe to call from any thread.
+    '''
+    with self._idle:
+      if articleID in self._queued: return False
+      self._queued.add(articleID)
+    self._loop.call_soon_threadsafe(self._queue.put_nowait, (articleID, url))
+    return True
+
+  def submitPending(self):
+    '''
+    Queues the stored articles which were not enriched yet.
+    Returns the number of articles queued.
+    '''
+    pending = self._db[Article._collectionKey].find({'enriched': False}, {'url': 1})
+    return sum(self.submit(doc['_id'], doc['url']) for doc in pending)
+
+  def pending(self):
+    '''
+    Returns the number of queued articles
+    '''
+    with self._idle:
+      return len(self._queued)
+
+  def join(self, timeout=None):
+    '''
+    Waits until every queued article is enriched.
+    Returns False on timeout.
+    '''
+    with self._idle:
+      return self._idle.wait_for(lambda: not self._queued, timeout)
+
+  def close(self):
+    '''
+    Stops the event loop and the NLP workers. Queued articles
+    which weren't enriched stay pending (see submitPending).
+    '''
+    asyncio.run_coroutine_threadsafe(self._cancelWorkers(), self._loop).result()
+    self._loop.call_soon_threadsafe(self._loop.stop)
+    self._thread.join()
+    self._loop.close()
+    self._pool.shutdown(cancel_futures=True)
+
+  def _run(self):
+    asyncio.set_event_loop(self._loop)
+    self._queue = asyncio.Queue()
+    # host -> semaphore limiting its concurrent fetches
+    self._hosts = {}
+    self._workers = [self._loop.create_task(self._worker()) for _ in range(self.fetchWorkers)]
+    self._ready.set()
+    self._loop.run_forever()
+
+  async def _cancelWorkers(self):
+    for worker in self._workers: worker.cancel()
+    await asyncio.gather(*self._workers, return_exceptions=True)
+
+  async def _worker(self):
+    '''
+    Enriches queued articles, one at a time
+    '''
+    while True:
+      articleID, url = await self._queue.get()
+      try:
+        await self._enrich(articleID, url)
+      except Exception as e:
+        logging.error(f'ArticleEnricher: {url} failed: {e}')
+      finally:
+        with self._idle:
+          self._queued.discard(articleID)
+          self._idle.notify_all()
+
+  async def _enrich(self, articleID, url):
+    '''
+    Fetches and analyzes an article, then stores the results
+    '''
+    parsed = False
+    try:
+      html = await self._fetch(url)
+      parsed = await self._loop.run_in_executor(self._pool, analyzeHTML, html, url)
+    except Exception as e:
+      logging.error(f'ArticleEnricher: {url} failed: {e}')
+
+    update = {'enriched': True}
+    if parsed:
+      (update['language'], update['keywords'], update['summary']) = parsed
+      self.enriched += 1
+    else:
+      self.failed += 1
+    await self._loop.run_in_executor(None, self._store, articleID, update)
+
+  async def _fetch(self, url):
+    '''
+    Fetches a page, at most hostLimit at a time per host,
+    retrying timeouts, connection errors and server errors
+    '''
+    host = urlsplit(url).hostname
+    if host not in self._hosts: self._hosts[host] = asyncio.Semaphore(self.hostLimit)
+    for attempt in range(self.retries+1):
+      try:
+        async with self._hosts[host]:
+          return await self._loop.run_in_executor(None, parse.fetchHTML, url, self.timeout, self.client)
+      except Exception as e:
+        if attempt == self.retries or not ArticleEnricher._retryable(e): raise
+      await asyncio.sleep(self.backoff * 2**attempt)
+
+  @staticmethod
+  def _retryable(e):
+    '''
+    Returns True if a failed fetch may succeed when retried
+    '''
+    if isinstance(e, HTTPError):
+      return e.code == 429 or e.code >= 500
+    return isinstance(e, (URLError, socket.timeout, ConnectionError, urllib3.exceptions.HTTPError))
+
+  def _store(self, articleID, update):
+    self._db[Article._collectionKey].update_one({'_id': articleID}, {'$set': update})
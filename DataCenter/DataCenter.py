@@ -1,11 +1,28 @@
 import pandas as pd
 import logging
-from pymongo import MongoClient, TEXT
+import time
+from datetime import timedelta
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from pymongo.errors import OperationFailure
 
 import DataCenter.Utils.dbutils as utils
 import DataCenter.Graph.graph as graph
+from DataCenter.DataCenterConfig import DataCenterConfig
+from DataCenter.Utils.bulk import BulkWriter
+from DataCenter.Utils.fetch import prefetch
+from DataCenter.Utils.ledger import IngestionLedger
+from DataCenter.Utils.lru import LRUCache
 from DataCenter.Actor.Actor import Actor
-from DataCenter.Graph.extraction import extractAndFilterData
+from DataCenter.Article.Article import Article
+from DataCenter.Article.ArticleEnricher import ArticleEnricher
+from DataCenter.Actor.ActorConnection import ActorConnection
+from DataCenter.Actor.ActorCache import ActorCache
+from DataCenter.Geo.GDeltLocation import GDeltLocation
+from DataCenter.Graph.extraction import extractAndFilterData, extractAndFilterFrame, extractAndStoreData, storeData, knownArticleMask, cacheLocationIDs, extractFrameLocations, EXTRACTION_COLUMNS
+from DataCenter.Graph.parallel import ParallelExtractor
+from DataCenter.Graph.actorgraph import ActorGraph
+from DataCenter.Graph.sparsegraph import SparseGraph
+from DataCenter.Graph.analytics import AnalyticsCache
 import DataCenter.Tests.tests as tests
 
 class DataCenter():
@@ -16,8 +33,11 @@ class DataCenter():
 
   TODO: Interface with MongoDB
   '''
+  _schemaCollectionKey = 'schema'
+  # version of the stored documents, see _migrate
+  _SCHEMA_VERSION = 1
 
-  def __init__(self, startDate, endDate, query=None):
+  def __init__(self, startDate, endDate, query=None, config=None, **options):
     '''
     Initializes a new DataCenter populated with data
     from the specified start date (inclusive) to the end date (exclusive)
@@ -28,9 +48,23 @@ class DataCenter():
 
     If no actors are specified, all actors will be included.
 
+    The storage, cache, fetching and worker options are given by config,
+    a DataCenterConfig (defaults if None), and options override single
+    options of it, e.g. DataCenter(start, end, query, batchSize=500).
+    Actor graph updates are accumulated in memory by an ActorGraph,
+    and flushed in bulk with the writes.
+
+    A DataCenter holds worker threads and processes: close it when done,
+    or use it as a context manager (with DataCenter(...) as dc: ...).
+
+    Files already recorded in the database's IngestionLedger are skipped,
+    see resume and updateTo.
+
     Dates should be formatted as follows:
     'YYYY MM DD'
     e.g. '2019 02 19'
+    If startDate is None, nothing is ingested on initialization
+    (see ingest, and DataCenterGroup).
 
     TODO: Filter by regions
     '''
@@ -43,10 +77,24 @@ class DataCenter():
   
     print('INITIALIZING DATA CENTER')
 
-    self._initDB()
+    config = (config or DataCenterConfig()).replace(**options)
+    self.config = config
+    self._initDB(config.client, config.dbName)
+    self.analyticsCache = AnalyticsCache(self._db)
+    # without batchSize, the graph updates of each article are written once it is stored
+    self.actorGraph = ActorGraph(self._db, config.batchSize or 1, self.analyticsCache)
+    self._writer = BulkWriter(self._db, config.batchSize, self._onExisting) if config.batchSize else None
+    self.actorCache = ActorCache(config.actorCacheSize)
+    self.actorCache.warm(self._db)
+    self.locationCache = LRUCache(config.locationCacheSize)
+    self.articleCache = LRUCache(config.articleCacheSize)
+    self.enricher = ArticleEnricher(self._db, config.enrichWorkers, client=config.httpClient) if config.enrichWorkers else None
+    self.ledger = IngestionLedger(self._db)
 
     # initialize data analysis variables
     self.totalDataCount = 0
+    self._knownCount = 0
+    self._failedCount = 0
     self.relevantDataCount = 0
 
     # initialize the headers of the dataframe
@@ -54,13 +102,30 @@ class DataCenter():
 
     # initialize regions
     self.query = query
+    self.columnar = config.columnar
+    self.fetchWorkers = config.fetchWorkers
+    self.sourceURL = config.sourceURL
+    self.archiveCache = config.archiveCache
+    self.snapshotStore = config.snapshotStore
+    self.chunkSize = config.chunkSize
+    self.queryCache = config.queryCache
+    if config.columnar and config.extractor:
+      self._extractor = config.extractor
+    else:
+      self._extractor = ParallelExtractor(query, config.extractWorkers) if config.columnar and config.extractWorkers else None
 
     # run unit tests
-    tests.runTests()
+    tests.runTests(self._client)
 
     # get dates to initialize the database
-    initDateStrings = utils.getDateRangeStrings(startDate, endDate)
-    [self.updateDC(dateString) for dateString in initDateStrings]
+    self.startDate = startDate
+    self.endDate = endDate
+    if startDate: self.ingest(utils.getDateRangeStrings(startDate, endDate))
+
+    if self.enricher:
+      print(f'Enriching {self.enricher.pending()} articles...')
+      self.enricher.join()
+      print(f'* Enriched: {self.enricher.enriched} articles, {self.enricher.failed} failed')
 
     print('DataCenter Initialized')
 
@@ -69,58 +134,359 @@ class DataCenter():
     print('\nInformation:')
     print(f'* Total Data Count: {self.totalDataCount} articles processed')
     print(f'* Relevant Information: {self.relevantDataCount} articles stored')
-    print(f'* Total Percentage: {self.relevantDataCount/self.totalDataCount:.0%}')
+    if self.totalDataCount:
+      print(f'* Total Percentage: {self.relevantDataCount/self.totalDataCount:.0%}')
+
+  def ingest(self, dateStrings):
+    '''
+    Updates the database with the GKG files of dateStrings which
+    are not in the ingestion ledger yet. Returns the number of files ingested.
+    '''
+    missing = self.ledger.missing(dateStrings)
+    if len(missing) < len(dateStrings):
+      print(f'* Skipping {len(dateStrings)-len(missing)} files already ingested')
+    ingested = 0
+    for dateString, frame in prefetch(missing, self.getDataFrame, self.fetchWorkers):
+      if self.updateDC(dateString, frame): ingested += 1
+    return ingested
+
+  def resume(self):
+    '''
+    Ingests the files of the initial date range which are missing,
+    e.g. after a crash or failed downloads
+    '''
+    return self.ingest(utils.getDateRangeStrings(self.startDate, self.endDate))
+
+  def updateTo(self, endDate=None):
+    '''
+    Ingests the files missing from the start date up to endDate
+    (exclusive, formatted 'YYYY MM DD'), or up to the latest GDelt
+    file if endDate is None. Call periodically to follow new files.
+    '''
+    if endDate:
+      endDateObject = utils.getDateTimeObject(endDate)
+      self.endDate = endDate
+    else:
+      endDateObject = utils.getLatestDateObject() + timedelta(minutes=1)
+
+    # the whole range, so files which failed before the latest one are retried
+    startDateString = utils.getDateTimeObject(self.startDate).strftime('%Y%m%d%H%M%S')
+    return self.ingest(utils.getDateStringsFrom(startDateString, endDateObject))
 
   def getDataFrame(self, dateString):
+    '''
+    Downloads and decodes the GKG file of dateString.
+    Returns (success, dataframe). Safe to call from worker threads.
+
+    If chunkSize is set, only the download happens here, and the dataframe
+    is replaced by an iterator of dataframe chunks, parsed as it is consumed.
+    '''
     try:
-      # get data url
-      url = utils.getDateURL(dateString)
+      if self.snapshotStore and self.snapshotStore.contains(dateString):
+        if self.chunkSize:
+          return True, self.snapshotStore.iterLoad(dateString, EXTRACTION_COLUMNS, self.chunkSize)
+        return True, self.snapshotStore.load(dateString, EXTRACTION_COLUMNS)
+
+      # get data url, or the locally cached archive (not evicted until read)
+      if self.archiveCache:
+        source = self.archiveCache.open(dateString, self.sourceURL)
+      else:
+        source = utils.getDateURL(dateString, self.sourceURL)
+
+      if self.chunkSize:
+        if not self.archiveCache: source = utils.downloadArchive(source)
+        chunks = utils.iterDataFrameChunks(source, self.headers, EXTRACTION_COLUMNS, self.chunkSize)
+        if self.snapshotStore:
+          chunks = self.snapshotStore.saveChunks(dateString, chunks)
+        return True, chunks
+
       # read in data file
-      df = pd.read_csv(url, compression='zip', encoding='latin1', header=None, sep='\t')
-      df.columns = self.headers
+      try:
+        df = utils.readDataFrame(source, self.headers)
+      finally:
+        if self.archiveCache: source.close()
+      if self.snapshotStore:
+        self.snapshotStore.save(dateString, df[EXTRACTION_COLUMNS])
       return True, df
     except Exception as e:
       logging.log(0, f'DataCenter.getDataFrame: {e}')
       return False, None
 
-  def updateDC(self, dateString):
+  def updateDC(self, dateString, frame=None, filtered=False, rowCount=None):
     '''
-    Updates the database with information from a single day
+    Updates the database with information from a single day.
+    frame is the (success, dataframe) result of getDataFrame, if already fetched.
+    If filtered is True, its rows have already passed the query filters.
+    If frame only holds some of the rows of the file (e.g. routed by a
+    DataCenterGroup), rowCount is the number of rows of the file, counted
+    in the totals and the ledger.
     '''
     print(f'* Processing {dateString} Information...')
-    success, df = self.getDataFrame(dateString)
+    success, frames = frame or self.getDataFrame(dateString)
     if not success: return False
+    if isinstance(frames, pd.DataFrame): frames = [frames]
 
-    totalCount = len(df)
-    print(f'** {totalCount} Rows')
+    totalCount = 0
     relevantCount = 0
-
-    for ix, data in df.iterrows():
-      if self.updateRow(data, dateString): relevantCount += 1
+    self._knownCount = 0
+    self._failedCount = 0
+    startTime = time.perf_counter()
+
+    # (urls, exact) matched by the query, or a broader one, on a previous run
+    cached = None
+    if self.queryCache and self.query and not filtered:
+      cached = self.queryCache.lookup(self.query, dateString)
+    if cached:
+      print(f'** Query Cache: replaying {len(cached[0])} {"matches" if cached[1] else "candidates of a broader query"}')
+    # the urls matched by the query, if they should be recorded
+    matched = [] if self.queryCache and self.query and self.columnar and not (cached and cached[1]) else None
+
+    filtered = filtered or bool(cached and cached[1])
+    try:
+      for df in frames:
+        totalCount += len(df)
+        frameFiltered = filtered
+        if cached:
+          df = df[df['DocumentIdentifier'].isin(cached[0])]
+        if not frameFiltered and (matched is not None or (self.columnar and not self._extractor)):
+          df = extractAndFilterFrame(df, self.query)
+          frameFiltered = True
+        if matched is not None:
+          matched.extend(df['DocumentIdentifier'])
+        if self.columnar:
+          relevantCount += self.updateFrame(df, dateString, frameFiltered)
+        else:
+          # rows are filtered one at a time, so the known articles are skipped first
+          df = df[~self._knownMask(df['DocumentIdentifier'])]
+          self._cacheLocations(extractFrameLocations(df))
+          for ix, data in df.iterrows():
+            if self.updateRow(data, dateString, frameFiltered): relevantCount += 1
+    except Exception as e:
+      logging.error(f'DataCenter.updateDC: {dateString} failed after {totalCount} rows: {e}')
+      success = False
+    if rowCount is not None: totalCount = rowCount
+    print(f'** {totalCount} Rows ({self._knownCount} known articles skipped)')
+
+    if success and matched is not None:
+      success &= self.queryCache.record(self.query, dateString, matched)
+    success &= self.flush()
+    roundTrips = self.actorGraph.roundTrips + (self._writer.roundTrips if self._writer else 0)
+    print(f'** Bulk Writes: {roundTrips} round trips')
+    logging.info(f'DataCenter.updateDC: {dateString} {roundTrips} bulk write round trips')
+    self.actorGraph.roundTrips = 0
+    if self._writer: self._writer.roundTrips = 0
+
+    # enrich the articles once they are flushed
+    if self.enricher:
+      print(f'** Enrichment: {self.enricher.submitPending()} articles queued')
+
+    actorStats = self.actorCache.stats()
+    print(f'** Actor Cache: {actorStats["hits"]} hits, {actorStats["misses"]} misses ({actorStats["hitRate"]:.0%})')
+    logging.info(f'DataCenter.updateDC: {dateString} actor cache {actorStats}')
+    self.actorCache.resetStats()
+
+    locationStats = self.locationCache.stats()
+    print(f'** Location Cache: {locationStats["hits"]} hits, {locationStats["misses"]} misses ({locationStats["hitRate"]:.0%})')
+    logging.info(f'DataCenter.updateDC: {dateString} location cache {locationStats}')
+    self.locationCache.resetStats()
+
+    elapsed = time.perf_counter() - startTime
+    rowRate = totalCount/elapsed if elapsed else float('inf')
 
     self.totalDataCount += totalCount
     self.relevantDataCount += relevantCount
 
     print(f'  {dateString} processed.')
     print(f'\n* {dateString} Information: ')
-    print(f'** Relevant Data: {relevantCount/totalCount:.0%}\n\n')
-    return True
+    if self._failedCount:
+      logging.error(f'DataCenter.updateDC: {dateString} {self._failedCount} rows failed, the file will be retried')
+      print(f'** {self._failedCount} rows failed')
+    if success: self.ledger.record(dateString, totalCount, relevantCount, elapsed, self._failedCount)
+    success = success and not self._failedCount
+
+    if totalCount: print(f'** Relevant Data: {relevantCount/totalCount:.0%}')
+    print(f'** Throughput: {rowRate:.0f} rows/sec\n\n')
+    logging.info(f'DataCenter.updateDC: {dateString} {totalCount} rows in {elapsed:.2f}s ({rowRate:.0f} rows/sec)')
+    return success
+
+  def updateFrame(self, df, dateString, filtered=False):
+    '''
+    Filters the whole dataframe with the query masks, then
+    stores the relevant rows. Returns the number of rows stored.
+    If filtered is True, the rows have already passed the query filters.
+    '''
+    relevantCount = 0
+    if self._extractor:
+      extracted = list(self._extractor.extract(df, filtered))
+      known = self._knownMask(pd.Series([row[0] for row in extracted], dtype=object))
+      extracted = [row for row, isKnown in zip(extracted, known) if not isKnown]
+      self._cacheLocations(loc for row in extracted for loc in row[3])
+      for row in extracted:
+        if self.updateExtracted(row, dateString): relevantCount += 1
+      return relevantCount
+
+    rows = df if filtered else extractAndFilterFrame(df, self.query)
+    rows = rows[~self._knownMask(rows['DocumentIdentifier'])]
+    self._cacheLocations(extractFrameLocations(rows))
+    for ix, data in rows.iterrows():
+      if self.updateRow(data, dateString, filtered=True): relevantCount += 1
+    return relevantCount
+
+  def _knownMask(self, urls):
+    '''
+    Returns the mask of the urls whose article is already stored
+    (by previous files or runs), counting them
+    '''
+    known = knownArticleMask(urls, self._db, self.articleCache)
+    self._knownCount += int(known.sum())
+    return known
+
+  def _cacheLocations(self, locations):
+    '''
+    Looks up the stored locations among locations, in bulk,
+    before their rows queue the upserts of the new ones
+    '''
+    if self._writer: cacheLocationIDs(locations, self._db, self.locationCache)
 
-  def updateRow(self, data, dateString):
+  def updateExtracted(self, extracted, dateString):
+    '''
+    Stores a row extracted by the ParallelExtractor and updates the actor graph
+    '''
     try:
-      logging.log(0, 'DataCenter.updateRow')
-      data = extractAndFilterData(data, dateString, self.query, self._db)
+      (url, peopleNames, orgNames, locations, actorKeys) = extracted
+      data = storeData(url, dateString, peopleNames, orgNames, locations,
+                       self._db, self._writer, self.actorCache, actorKeys, self.locationCache, self.articleCache,
+                       self.enricher is None)
       if not data: return False
 
-      (articleID, actorIDs, locationIDs) = data
+      return self._updateGraph(data, dateString)
+    except Exception as e:
+      logging.error(f'DataCenter.updateExtracted: {e}')
+      self._failedCount += 1
+      return False
 
-      # update actor Graph
-      if not graph.updateGraph(articleID, actorIDs, self._db): return False
+  def updateRow(self, data, dateString, filtered=False):
+    '''
+    Stores a single row and updates the actor graph. If filtered is True,
+    the row has already passed the query filters.
+    '''
+    try:
+      logging.log(0, 'DataCenter.updateRow')
+      if filtered:
+        data = extractAndStoreData(data, dateString, self._db, self._writer, self.actorCache,
+                                   self.locationCache, self.articleCache, self.enricher is None)
+      else:
+        data = extractAndFilterData(data, dateString, self.query, self._db, self._writer, self.actorCache,
+                                    self.locationCache, self.articleCache, self.enricher is None)
+      if not data: return False
 
-      return True
+      return self._updateGraph(data, dateString)
     except Exception as e:
-      logging.log(0, e)
+      logging.error(f'DataCenter.updateRow: {e}')
+      self._failedCount += 1
+      return False
+
+  def _updateGraph(self, data, dateString):
+    '''
+    Updates the actor graph with a stored row
+    '''
+    (articleID, actorIDs, locationIDs) = data
+
+    # update actor Graph
+    if not graph.updateGraph(articleID, actorIDs, self._db, self.actorGraph, dateString):
+      self._failedCount += 1
+      return False
+
+    # a failed batch loses the rows queued with it: the file must be retried
+    flushed = self._writer.rowDone() if self._writer else True
+    if self.actorGraph.full(): flushed &= self.flush()
+    if not flushed:
+      logging.error(f'DataCenter._updateGraph: {dateString} bulk write failed')
+      self._failedCount += 1
       return False
+    return True
+
+  def _onExisting(self, collectionKey, upserts):
+    '''
+    Handles the queued upserts which matched a document already stored
+    (by another process): their ObjectIds were never inserted.
+    The graph updates of such articles are dropped, and the articles
+    referencing such locations are pointed to the stored location.
+    '''
+    if collectionKey == Article._collectionKey:
+      logging.info(f'DataCenter: {len(upserts)} articles were already stored')
+      self.actorGraph.discardArticles([doc['_id'] for query, doc in upserts])
+    elif collectionKey == GDeltLocation._collection:
+      logging.info(f'DataCenter: {len(upserts)} locations were already stored')
+      storedIDs = {}
+      for query, doc in upserts:
+        stored = self._db[GDeltLocation._collection].find_one(query, {'_id': 1})
+        if not stored: continue
+        storedIDs[doc['_id']] = stored['_id']
+        self.locationCache.put(tuple(query.values()), stored['_id'])
+      articles = self._db[Article._collectionKey]
+      updates = [UpdateOne({'_id': article['_id']}, {'$set': {
+                   'locationIDs': [storedIDs.get(locationID, locationID) for locationID in article['locationIDs']]}})
+                 for article in articles.find({'locationIDs': {'$in': list(storedIDs)}}, {'locationIDs': 1})]
+      if updates: articles.bulk_write(updates, ordered=False)
+
+  def flush(self):
+    '''
+    Flushes the pending writes, then the actor graph updates
+    which reference them. Returns True if every write was acknowledged.
+    '''
+    success = self._writer.flush() if self._writer else True
+    success &= self.actorGraph.flush()
+    return success
+
+  def close(self):
+    '''
+    Flushes pending writes and releases the worker processes.
+    Articles not enriched yet are enriched on the next run.
+    '''
+    self.flush()
+    if self.archiveCache: self.archiveCache.flush()
+    # a shared extractor is closed by its owner
+    if self._extractor and self._extractor is not self.config.extractor: self._extractor.close()
+    if self.enricher: self.enricher.close()
+    self._extractor = None
+    self.enricher = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.close()
+    return False
+
+  def visualizeGraph(self, path='temp/graph.graphml', image='temp/graph.png', minStrength=1,
+                     startDate=None, endDate=None, topK=None):
+    '''
+    Exports the actor graph to path (GraphML or GEXF, from its extension)
+    and, if image is set, renders it there. Keeps the connections of
+    strength >= minStrength, counted from startDate (inclusive) to endDate
+    (exclusive) if either is given ('YYYY MM DD'), and, if topK is set,
+    only the topK strongest connections of each actor.
+    Returns the SparseGraph.
+    '''
+    startDay = utils.getDateTimeObject(startDate).strftime('%Y%m%d') if startDate else None
+    endDay = utils.getDateTimeObject(endDate).strftime('%Y%m%d') if endDate else None
+    actorGraph = SparseGraph.fromDB(self._db, minStrength, startDay, endDay, topK)
+    print(f'* Actor graph: {actorGraph.nodeCount()} actors, {actorGraph.edgeCount()} connections')
+    if path: print(f'* Exported to {actorGraph.export(path)}')
+    if image and actorGraph.render(image): print(f'* Rendered to {image}')
+    return actorGraph
+
+  def analyzeGraph(self, startDate=None, endDate=None, minStrength=1):
+    '''
+    Returns the GraphAnalytics (centralities, communities, ego networks)
+    of the actor graph, counted from startDate (inclusive) to endDate
+    (exclusive) if either is given ('YYYY MM DD'). Cached, and kept up
+    to date with the edges ingested afterwards.
+    '''
+    startDay = utils.getDateTimeObject(startDate).strftime('%Y%m%d') if startDate else None
+    endDay = utils.getDateTimeObject(endDate).strftime('%Y%m%d') if endDate else None
+    return self.analyticsCache.get(startDay, endDay, minStrength, self.query.key() if self.query else None)
 
   def addRegion(self, region):
     '''
@@ -146,10 +512,75 @@ class DataCenter():
     '''
     return
 
-  def _initDB(self):
+  def _migrate(self):
+    '''
+    Migrates the documents stored by previous versions, once per database:
+    the version reached is recorded in the schema collection
+    '''
+    schema = self._db[DataCenter._schemaCollectionKey]
+    stored = schema.find_one({'_id': 'version'})
+    if stored and stored['version'] >= DataCenter._SCHEMA_VERSION: return
+
+    try:
+      # actors are matched on their DoubleMetaphone codes, not a text index
+      actors = self._db[Actor._collectionKey]
+      if '_a_name_text' in actors.index_information():
+        actors.drop_index('_a_name_text')
+      Actor.migrate(self._db)
+      # connections are keyed on their canonical actor pair
+      ActorConnection.migrate(self._db)
+    except OperationFailure as e:
+      logging.error(f'DataCenter._migrate: migration failed, retried on the next run: {e}')
+      return
+    schema.replace_one({'_id': 'version'}, {'version': DataCenter._SCHEMA_VERSION}, upsert=True)
+
+  def _initDB(self, client=None, dbName='test_database_4'):
     # initializing DB client connection
-    self._client = MongoClient()
-    self._db = self._client.test_database_4
+    self._client = client or MongoClient()
+    self._db = self._client[dbName]
 
-    # ensure querying on Actor DoubleMetaphone
-    self._db[Actor._collectionKey].create_index([('_a_name', TEXT)])
\ No newline at end of file
+    self._migrate()
+
+    # ensure querying on Actor DoubleMetaphone codes
+    self._db[Actor._collectionKey].create_index([('actorType', ASCENDING), ('_a_keys', ASCENDING)])
+
+    # ensure a single connection per canonical actor pair
+    # (partial, as connections stored before have no actorA / actorB)
+    try:
+      self._db[ActorConnection._collectionKey].create_index(
+        [('actorA', ASCENDING), ('actorB', ASCENDING)], unique=True,
+        partialFilterExpression={'actorA': {'$exists': True}})
+    except OperationFailure as e:
+      logging.error(f'DataCenter._initDB: actor_connection has duplicate actor pairs: {e}')
+
+    # ensure a single bucket per actor / actor pair and day,
+    # and querying buckets by time window
+    try:
+      self._db[Actor._bucketCollectionKey].create_index(
+        [('actorID', ASCENDING), ('day', ASCENDING)], unique=True)
+    except OperationFailure as e:
+      logging.error(f'DataCenter._initDB: duplicate actor buckets: {e}')
+    try:
+      self._db[ActorConnection._bucketCollectionKey].create_index(
+        [('actorA', ASCENDING), ('actorB', ASCENDING), ('day', ASCENDING)], unique=True)
+    except OperationFailure as e:
+      logging.error(f'DataCenter._initDB: duplicate actor connection buckets: {e}')
+    self._db[Actor._bucketCollectionKey].create_index([('day', ASCENDING)])
+    self._db[ActorConnection._bucketCollectionKey].create_index([('day', ASCENDING)])
+
+    # ensure storing each location once
+    try:
+      self._db[GDeltLocation._collection].create_index(
+        [('type', ASCENDING), ('name', ASCENDING), ('latitude', ASCENDING), ('longitude', ASCENDING)],
+        unique=True)
+    except OperationFailure as e:
+      logging.error(f'DataCenter._initDB: location collection has duplicates, remove them to deduplicate: {e}')
+
+    # ensure storing each article once (sparse, as older articles have no urlHash)
+    try:
+      self._db[Article._collectionKey].create_index([('urlHash', ASCENDING)], unique=True, sparse=True)
+    except OperationFailure as e:
+      logging.error(f'DataCenter._initDB: article collection has duplicate urlHashes: {e}')
+    # ensure finding the articles to enrich
+    self._db[Article._collectionKey].create_index([('enriched', ASCENDING)],
+      partialFilterExpression={'enriched': False})
\ No newline at end of file
@@ -0,0 +1,90 @@
+import DataCenter.Utils.dbutils as utils
+
+class DataCenterConfig():
+  '''
+  Defines the options of a DataCenter (or of the DataCenters of a
+  DataCenterGroup). Every option has a default, so only the ones
+  which differ need to be given.
+
+  If columnar is True, each GKG file is filtered as a whole with
+  vectorized masks and only the relevant rows are persisted.
+  Otherwise, each row is extracted and filtered individually.
+
+  If batchSize is set, writes are gathered by a BulkWriter and flushed
+  every batchSize stored rows and at the end of each GKG file.
+  Otherwise, every write is sent to MongoDB immediately.
+
+  Actor names are resolved through an LRU ActorCache of actorCacheSize
+  actors, warmed from the actor collection.
+
+  Each distinct location (type, name, latitude, longitude) is stored
+  once, and its ObjectId is kept in an LRU cache of locationCacheSize
+  locations.
+
+  Articles are stored once per normalized URL. Rows whose article is
+  already stored are skipped before extraction; the hashes of known
+  URLs are kept in an LRU cache of articleCacheSize articles.
+
+  If enrichWorkers is set, articles are stored unparsed, and an
+  ArticleEnricher fetches and analyzes them in the background with
+  enrichWorkers concurrent fetches. Otherwise, each article is parsed
+  before it is stored.
+
+  Article pages are fetched through httpClient (an HTTPClient,
+  e.g. with an on-disk response cache) if given.
+
+  GKG files are downloaded and decoded by fetchWorkers threads, ahead
+  of the file being processed. sourceURL is the base URL of the files.
+
+  If an ArchiveCache is given, the raw files are read through it.
+
+  If a FrameSnapshotStore is given, parsed files are snapshotted to it,
+  and read back from it on later runs.
+
+  If chunkSize is set, each file is streamed in chunks of chunkSize rows,
+  reading only the extraction columns, and each chunk goes through
+  filtering, extraction and persistence before the next one is read.
+
+  If extractWorkers is set (columnar mode only), filtering and extraction
+  run on that many worker processes, and this process only persists.
+  A ParallelExtractor given as extractor is used instead (e.g. shared by
+  the DataCenters of a DataCenterGroup), and left open on close.
+
+  If a QueryCache is given, the rows of each file matched by the query
+  are recorded in it (columnar mode only). Files the query, or a broader
+  query, was already run over replay the recorded matches instead.
+
+  client and dbName select the MongoDB database (defaults to a local client).
+  '''
+
+  def __init__(self, columnar=True, batchSize=1000, actorCacheSize=100000, fetchWorkers=4,
+               sourceURL=utils.GKG_BASE_URL, archiveCache=None, snapshotStore=None, chunkSize=None,
+               extractWorkers=None, extractor=None, locationCacheSize=100000, articleCacheSize=200000,
+               enrichWorkers=None, httpClient=None, queryCache=None, client=None, dbName='test_database_4'):
+    '''
+    Initializes the options, see the class description
+    '''
+    self.columnar = columnar
+    self.batchSize = batchSize
+    self.actorCacheSize = actorCacheSize
+    self.fetchWorkers = fetchWorkers
+    self.sourceURL = sourceURL
+    self.archiveCache = archiveCache
+    self.snapshotStore = snapshotStore
+    self.chunkSize = chunkSize
+    self.extractWorkers = extractWorkers
+    self.extractor = extractor
+    self.locationCacheSize = locationCacheSize
+    self.articleCacheSize = articleCacheSize
+    self.enrichWorkers = enrichWorkers
+    self.httpClient = httpClient
+    self.queryCache = queryCache
+    self.client = client
+    self.dbName = dbName
+
+  def replace(self, **options):
+    '''
+    Returns a copy of the config with options changed.
+    Raises TypeError on an unknown option.
+    '''
+    return DataCenterConfig(**{**vars(self), **options})
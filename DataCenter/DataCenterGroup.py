@@ -0,0 +1,122 @@
+import logging
+import pandas as pd
+from pymongo import MongoClient
+
+import DataCenter.Utils.dbutils as utils
+from DataCenter.DataCenter import DataCenter
+from DataCenter.DataCenterConfig import DataCenterConfig
+from DataCenter.Graph.extraction import filterFrameMany
+from DataCenter.Graph.parallel import ParallelExtractor
+from DataCenter.Query.QuerySet import QuerySet
+from DataCenter.Utils.fetch import prefetch
+
+class DataCenterGroup():
+  '''
+  Creates a DataCenterGroup, which serves several clients from a
+  single pass over the GKG files: one DataCenter (database) per client
+  query, all fed by the same downloads.
+
+  Each file is downloaded and decoded once, filtered once for all the
+  queries (see QuerySet), and only the rows relevant to each client
+  are routed to its DataCenter. The DataCenters share a single
+  ParallelExtractor, and parse their articles inline (no enricher).
+
+  A DataCenterGroup should be closed when done, or used as a context manager.
+  '''
+
+  def __init__(self, startDate, endDate, queries, config=None, **options):
+    '''
+    Initializes the DataCenters of queries, a dictionary of database name
+    to Query, then ingests the files from the start date (inclusive)
+    to the end date (exclusive), formatted 'YYYY MM DD'.
+
+    config is the DataCenterConfig of every client (defaults if None),
+    and options override single options of it. The databases are those
+    of queries on config.client, and if config.extractWorkers is set,
+    the routed rows are extracted on that many worker processes, shared
+    by the clients.
+    '''
+    print('INITIALIZING DATA CENTER GROUP')
+    config = (config or DataCenterConfig()).replace(**options)
+    self.config = config
+    self._client = config.client or MongoClient()
+    self.fetchWorkers = config.fetchWorkers
+    self.dbNames = list(queries)
+    self.querySet = QuerySet(queries.values())
+    # the routed rows are already filtered, so the workers need no query
+    self._extractor = ParallelExtractor(None, config.extractWorkers) if config.extractWorkers else None
+    self.dataCenters = {
+      dbName: DataCenter(None, None, query=query,
+                         config=config.replace(client=self._client, dbName=dbName, enrichWorkers=None,
+                                               extractWorkers=None, extractor=self._extractor))
+      for dbName, query in queries.items()
+    }
+
+    self.startDate = startDate
+    self.endDate = endDate
+    if startDate: self.ingest(utils.getDateRangeStrings(startDate, endDate))
+    print('DataCenter Group Initialized')
+
+  def ingest(self, dateStrings):
+    '''
+    Ingests the GKG files of dateStrings which are missing from the
+    ledger of at least one DataCenter, into the DataCenters missing them.
+    Returns the number of files ingested.
+    '''
+    missing = {dbName: set(self.dataCenters[dbName].ledger.missing(dateStrings)) for dbName in self.dbNames}
+    dateStrings = [dateString for dateString in dateStrings
+                   if any(dateString in missing[dbName] for dbName in self.dbNames)]
+    # every DataCenter decodes the files the same way
+    reader = self.dataCenters[self.dbNames[0]]
+
+    ingested = 0
+    for dateString, frame in prefetch(dateStrings, reader.getDataFrame, self.fetchWorkers):
+      targets = [qx for qx, dbName in enumerate(self.dbNames) if dateString in missing[dbName]]
+      if self.updateGroup(dateString, frame, targets): ingested += 1
+    return ingested
+
+  def updateGroup(self, dateString, frame, targets=None):
+    '''
+    Filters a file for all the queries, then updates each DataCenter of
+    targets (query indices, all by default) with its relevant rows.
+    frame is the (success, dataframe) result of getDataFrame.
+    '''
+    print(f'* Routing {dateString} to {len(self.dbNames)} clients...')
+    success, frames = frame
+    if not success: return False
+    if isinstance(frames, pd.DataFrame): frames = [frames]
+    targets = range(len(self.dbNames)) if targets is None else targets
+
+    routed = {qx: [] for qx in targets}
+    totalCount = 0
+    try:
+      for df in frames:
+        totalCount += len(df)
+        relevant = filterFrameMany(df, self.querySet)
+        for qx in targets:
+          routed[qx].append(df[relevant[qx].values])
+    except Exception as e:
+      logging.error(f'DataCenterGroup.updateGroup: {dateString} failed after {totalCount} rows: {e}')
+      return False
+
+    for qx in targets:
+      print(f'** {self.dbNames[qx]}: {sum(len(df) for df in routed[qx])} of {totalCount} rows')
+      dataCenter = self.dataCenters[self.dbNames[qx]]
+      success &= dataCenter.updateDC(dateString, (True, routed[qx]), filtered=True, rowCount=totalCount)
+    return success
+
+  def close(self):
+    '''
+    Closes every DataCenter, and the shared ParallelExtractor
+    '''
+    for dataCenter in self.dataCenters.values():
+      dataCenter.close()
+    if self._extractor: self._extractor.close()
+    self._extractor = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.close()
+    return False
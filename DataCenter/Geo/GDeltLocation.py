@@ -19,6 +19,14 @@ class GDeltLocation(Location):
     self.type = type_dict[type]
     super().__init__(**kwds)
 
+  def identity(self):
+    '''
+    Returns the fields identifying the GDelt Location
+    '''
+    main = super().identity()
+    main['type'] = self.type
+    return main
+
   def _serialize(self, format='bson'):
     '''
     Serializes the GDelt Location
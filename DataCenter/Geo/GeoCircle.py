@@ -1,3 +1,4 @@
+import numpy as np
 from DataCenter.Geo.Location import Location
 from DataCenter.Geo.Geography import Geography
 from DataCenter.Geo import geoutils
@@ -25,7 +26,28 @@ class GeoCircle(Geography):
     Returns True if the coordinate is within the region,
     False otherwise
     '''
-    return geoutils.distance(self.center, (location.latitude, location.longitude)) < self.radius
+    return bool(self.includesMany([location.latitude], [location.longitude])[0])
+
+  def includesMany(self, latitudes, longitudes):
+    '''
+    Vectorized includes, using the haversine distance to the center
+    '''
+    distances = geoutils.haversine(self.center.latitude, self.center.longitude, latitudes, longitudes)
+    return distances < self.radius
+
+  def bounds(self):
+    '''
+    Returns the bounding box (south, west, north, east) of the circle
+    '''
+    latitudeDelta = self.radius/geoutils.KM_PER_DEGREE
+    south = max(self.center.latitude - latitudeDelta, -90.0)
+    north = min(self.center.latitude + latitudeDelta, 90.0)
+    # the widest point of the circle is at the latitude closest to a pole
+    cosine = np.cos(np.radians(max(abs(south), abs(north))))
+    if cosine <= 0 or latitudeDelta/cosine >= 180:
+      return (south, -180.0, north, 180.0)
+    longitudeDelta = latitudeDelta/cosine
+    return (south, self.center.longitude - longitudeDelta, north, self.center.longitude + longitudeDelta)
 
   def setCenter(self, coord):
     '''
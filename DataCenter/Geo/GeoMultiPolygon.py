@@ -0,0 +1,24 @@
+from DataCenter.Geo.Geography import Geography
+from DataCenter.Geo.GeoPolygon import GeoPolygon
+
+class GeoMultiPolygon(GeoPolygon):
+  '''
+  Defines the GeoMultiPolygon class. A GeoMultiPolygon is defined by
+  polygons = [rings, ...], each as the rings of a GeoPolygon, and
+  includes the coordinates within any of its polygons.
+
+  TODO: Interface with MongoDB
+  '''
+
+  def __init__(self, polygons, **kwds):
+    '''
+    Initializes the GeoMultiPolygon from its polygons
+    '''
+    Geography.__init__(self, **kwds)
+    self._setPolygons(polygons)
+
+  def toGeoJSON(self):
+    '''
+    Returns the GeoJSON geometry of the polygons
+    '''
+    return {'type': 'MultiPolygon', 'coordinates': self.polygons}
@@ -0,0 +1,157 @@
+import json
+import numpy as np
+from DataCenter.Geo.Geography import Geography
+
+try:
+  # shapely >= 2.0, for the vectorized predicates
+  from shapely import contains_xy, prepare
+  from shapely.geometry import shape
+except ImportError:
+  shape = None
+
+class GeoPolygon(Geography):
+  '''
+  Defines the GeoPolygon class. A GeoPolygon is defined by
+  rings = [exterior, *holes], each ring a list of (longitude, latitude)
+  coordinates, as in GeoJSON.
+
+  Point-in-polygon tests are batched over coordinate arrays, after a
+  bounding box prefilter. Uses prepared shapely geometries when
+  installed, NumPy ray casting otherwise.
+
+  TODO: Interface with MongoDB
+  '''
+
+  def __init__(self, rings, **kwds):
+    '''
+    Initializes the GeoPolygon from its rings
+    '''
+    super().__init__(**kwds)
+    self._setPolygons([rings])
+
+  @staticmethod
+  def fromGeoJSON(source, name=None, **kwds):
+    '''
+    Returns a GeoPolygon or GeoMultiPolygon from a GeoJSON file path or
+    dictionary (Polygon, MultiPolygon, Feature or FeatureCollection).
+    The name defaults to the 'name' property of the feature.
+    '''
+    from DataCenter.Geo.GeoMultiPolygon import GeoMultiPolygon
+
+    if isinstance(source, str):
+      with open(source) as f:
+        source = json.load(f)
+
+    properties = {}
+    if source['type'] == 'FeatureCollection':
+      features = source['features']
+      if len(features) == 1:
+        properties = features[0].get('properties') or {}
+      geometries = [feature['geometry'] for feature in features]
+    elif source['type'] == 'Feature':
+      properties = source.get('properties') or {}
+      geometries = [source['geometry']]
+    else:
+      geometries = [source]
+
+    polygons = []
+    for geometry in geometries:
+      if geometry['type'] == 'Polygon':
+        polygons.append(geometry['coordinates'])
+      elif geometry['type'] == 'MultiPolygon':
+        polygons.extend(geometry['coordinates'])
+      else:
+        raise ValueError(f'GeoPolygon.fromGeoJSON: unsupported geometry {geometry["type"]}')
+
+    name = name or properties.get('name') or properties.get('NAME')
+    if len(polygons) == 1:
+      return GeoPolygon(polygons[0], name=name, **kwds)
+    return GeoMultiPolygon(polygons, name=name, **kwds)
+
+  def includes(self, location):
+    '''
+    Returns True if the coordinate is within the polygon,
+    False otherwise
+    '''
+    return bool(self.includesMany([location.latitude], [location.longitude])[0])
+
+  def includesMany(self, latitudes, longitudes):
+    '''
+    Vectorized includes, tested polygon by polygon
+    within the bounding box of each polygon
+    '''
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    inside = np.zeros(len(latitudes), dtype=bool)
+    for (south, west, north, east), rings, prepared in zip(self._bounds, self._arrays, self._prepared):
+      inBox = ~inside & (latitudes >= south) & (latitudes <= north) & (longitudes >= west) & (longitudes <= east)
+      if not inBox.any(): continue
+      if prepared is not None:
+        inside[inBox] = contains_xy(prepared, longitudes[inBox], latitudes[inBox])
+      else:
+        inside[inBox] = GeoPolygon._rayCast(rings, latitudes[inBox], longitudes[inBox])
+    return inside
+
+  def bounds(self):
+    '''
+    Returns the bounding box (south, west, north, east) of the polygons
+    '''
+    boxes = np.array(self._bounds)
+    return (float(boxes[:, 0].min()), float(boxes[:, 1].min()), float(boxes[:, 2].max()), float(boxes[:, 3].max()))
+
+  def toGeoJSON(self):
+    '''
+    Returns the GeoJSON geometry of the polygon
+    '''
+    return {'type': 'Polygon', 'coordinates': self.polygons[0]}
+
+  def _setPolygons(self, polygons):
+    '''
+    Sets the polygons, and precomputes their bounding boxes
+    and prepared geometries
+    '''
+    self.polygons = [[[list(map(float, coord)) for coord in ring] for ring in rings] for rings in polygons]
+    self._arrays = [[np.array(ring)[:, :2] for ring in rings] for rings in self.polygons]
+    self._bounds = []
+    for rings in self._arrays:
+      exterior = rings[0]
+      self._bounds.append((exterior[:, 1].min(), exterior[:, 0].min(), exterior[:, 1].max(), exterior[:, 0].max()))
+    if shape:
+      self._prepared = [GeoPolygon._prepare(rings) for rings in self.polygons]
+    else:
+      self._prepared = [None for _ in self.polygons]
+
+  @staticmethod
+  def _prepare(rings):
+    '''
+    Returns a prepared shapely geometry of the rings
+    '''
+    geometry = shape({'type': 'Polygon', 'coordinates': rings})
+    if not geometry.is_valid: geometry = geometry.buffer(0)
+    prepare(geometry)
+    return geometry
+
+  @staticmethod
+  def _rayCast(rings, latitudes, longitudes):
+    '''
+    Even-odd ray casting over the rings of a polygon (holes included),
+    vectorized over the coordinates
+    '''
+    inside = np.zeros(len(latitudes), dtype=bool)
+    for ring in rings:
+      x1, y1 = ring[:, 0], ring[:, 1]
+      x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+      for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        if ay == by: continue
+        crosses = (ay > latitudes) != (by > latitudes)
+        x = ax + (latitudes - ay)*(bx - ax)/(by - ay)
+        inside ^= crosses & (longitudes < x)
+    return inside
+
+  def _serialize(self, format='bson'):
+    '''
+    Serializes the GeoPolygon object
+    '''
+    main = super()._serialize()
+    main['geometry'] = self.toGeoJSON()
+    return main
@@ -1,3 +1,4 @@
+import numpy as np
 from DataCenter.Geo.Geography import Geography
 from DataCenter.Geo import geoutils
 
@@ -10,6 +11,8 @@ class GeoRectangle(Geography):
   TODO: support 'miles' and 'km'
   TODO: Interface with MongoDB
   '''
+  _matchesName = True
+
   def __init__(self, boundaries, **kwds):
     '''
     Initializes the Region class around the center with
@@ -28,6 +31,20 @@ class GeoRectangle(Geography):
     return ((coord[0] < self.north and coord[0] > self.south) and
       (coord[1] < self.east and coord[1] > self.west))
 
+  def includesMany(self, latitudes, longitudes):
+    '''
+    Vectorized includes, on coordinates only
+    '''
+    latitudes, longitudes = np.asarray(latitudes), np.asarray(longitudes)
+    return ((latitudes < self.north) & (latitudes > self.south) &
+      (longitudes < self.east) & (longitudes > self.west))
+
+  def bounds(self):
+    '''
+    Returns the bounding box (south, west, north, east)
+    '''
+    return (self.south, self.west, self.north, self.east)
+
   def setNorth(self, north):
     '''
     Moves the north location to the specified new location
@@ -1,4 +1,5 @@
 import logging
+import numpy as np
 from DataCenter.Geo.Location import Location
 
 class Geography():
@@ -8,6 +9,8 @@ class Geography():
   TODO: Interface with MongoDB
   '''
   _collection = 'geography'
+  # True if a location named like the geography is included (see includesMany)
+  _matchesName = False
 
   def __init__(self, name, unit='km', description=None, db=None, **kwds):
     '''
@@ -39,6 +42,20 @@ class Geography():
     '''
     return True
 
+  def includesMany(self, latitudes, longitudes):
+    '''
+    Vectorized includes. Returns a boolean array, True for each
+    coordinate in the Geography. Overrided by inherited classes.
+    '''
+    return np.ones(len(latitudes), dtype=bool)
+
+  def bounds(self):
+    '''
+    Returns the bounding box (south, west, north, east) of the Geography.
+    Overrided by inherited classes.
+    '''
+    return (-90.0, -180.0, 90.0, 180.0)
+
   def storeDB(self, db):
     '''
     Stores in database
@@ -55,7 +72,27 @@ class Geography():
     Serializes the geography
     '''
     return {
+      'type': self.__class__.__name__,
       'unit': self.unit,
       'description': self.description,
       'name': self.name
-    }
\ No newline at end of file
+    }
+
+  @classmethod
+  def fromDB(cls, obj):
+    '''
+    Creates a Geography from its serialization, as the class of its type
+    '''
+    from DataCenter.Geo.GeoRectangle import GeoRectangle
+    from DataCenter.Geo.GeoCircle import GeoCircle
+    from DataCenter.Geo.GeoPolygon import GeoPolygon
+
+    kwds = {'name': obj.get('name'), 'unit': obj.get('unit', 'km'), 'description': obj.get('description')}
+    geographyType = obj.get('type', 'Geography')
+    if geographyType == 'GeoRectangle':
+      return GeoRectangle((obj['north'], obj['south'], obj['east'], obj['west']), **kwds)
+    if geographyType == 'GeoCircle':
+      return GeoCircle((obj['center']['latitude'], obj['center']['longitude']), obj['radius'], **kwds)
+    if geographyType in ('GeoPolygon', 'GeoMultiPolygon'):
+      return GeoPolygon.fromGeoJSON(obj['geometry'], **kwds)
+    return Geography(**kwds)
\ No newline at end of file
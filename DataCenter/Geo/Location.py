@@ -1,4 +1,6 @@
 import logging
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 class Location():
   '''
@@ -55,17 +57,56 @@ class Location():
 
     return True
 
-  def storeDB(self, db):
+  def storeDB(self, db, writer=None):
     '''
-    Stores in database
+    Stores in database. If a BulkWriter is given, the insert is queued.
     '''
     if not db:
       logging.error('No DB provided')
       return False
-    self._mongoID = db[Location._collection].insert_one(self._serialize()).inserted_id
+    if writer:
+      self._mongoID = writer.insert(Location._collection, self._serialize())
+    else:
+      self._mongoID = db[Location._collection].insert_one(self._serialize()).inserted_id
+    self._id = str(self._mongoID)
+    return self._mongoID
+
+  def upsertDB(self, db, writer=None):
+    '''
+    Stores in database, unless an identical location (see identity)
+    is already stored. Returns the ObjectId of the stored location.
+    If a BulkWriter is given, the upsert is queued, and its ObjectId
+    returned: the location should be looked up first (see
+    extraction.cacheLocationIDs).
+    '''
+    if not db:
+      logging.error('No DB provided')
+      return False
+    if writer:
+      self._mongoID = writer.upsert(Location._collection, self.identity(), self._serialize())
+      self._id = str(self._mongoID)
+      return self._mongoID
+    collection = db[Location._collection]
+    try:
+      doc = collection.find_one_and_update(self.identity(), {'$setOnInsert': self._serialize()},
+        projection={'_id': 1}, upsert=True, return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+      # inserted concurrently, by another ingestion process
+      doc = collection.find_one(self.identity(), {'_id': 1})
+    self._mongoID = doc['_id']
     self._id = str(self._mongoID)
     return self._mongoID
 
+  def identity(self):
+    '''
+    Returns the fields identifying the location
+    '''
+    return {
+      'name': self.name,
+      'latitude': self.latitude,
+      'longitude': self.longitude
+    }
+
   def _serialize(self, format='bson'):
     '''
     Serializes the location class
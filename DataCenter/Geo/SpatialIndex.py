@@ -0,0 +1,141 @@
+import numpy as np
+
+class SpatialIndex():
+  '''
+  Defines a SpatialIndex over a set of Geographies.
+
+  Each Geography is registered in the cells of a regular lat-long grid
+  that its bounding box overlaps. A coordinate is only tested against the
+  Geographies of its cell, first with their bounding box, then exactly,
+  vectorized over all the coordinates of the cell. Geographies covering
+  most of the grid are tested against every coordinate instead.
+  '''
+
+  def __init__(self, geographies, cellSize=1.0, maxCells=10000):
+    '''
+    Initializes the index with cells of cellSize degrees. Geographies
+    overlapping more than maxCells cells are not gridded.
+    '''
+    self.geographies = list(geographies)
+    self.cellSize = cellSize
+    # names which are included by name (see Geography._matchesName)
+    self._names = {geo.name for geo in self.geographies if geo._matchesName}
+
+    # cell -> indices of the geographies overlapping it
+    self._cells = {}
+    self._global = []
+    self._boxes = []
+    for ix, geo in enumerate(self.geographies):
+      boxes = SpatialIndex._splitBounds(geo.bounds())
+      self._boxes.append(np.array(boxes))
+      cells = [cell for box in boxes for cell in self._boxCells(box)]
+      if len(cells) > maxCells:
+        self._global.append(ix)
+        continue
+      for cell in cells:
+        self._cells.setdefault(cell, []).append(ix)
+
+  def includes(self, location):
+    '''
+    Returns True if location is in one of the geographies
+    '''
+    return bool(self.includesMany([location.name], [location.latitude], [location.longitude])[0])
+
+  def includesMany(self, names, latitudes, longitudes):
+    '''
+    Returns a boolean array, True for each location
+    (name, latitude, longitude) in one of the geographies
+    '''
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    inside = np.zeros(len(latitudes), dtype=bool)
+    if not len(inside): return inside
+
+    if self._names:
+      inside |= np.array([name in self._names for name in names], dtype=bool)
+
+    for ix in self._global:
+      remaining = ~inside
+      inside[remaining] |= self._includes(ix, latitudes[remaining], longitudes[remaining])
+
+    if self._cells:
+      rows = np.floor(latitudes/self.cellSize).astype(np.int64)
+      columns = np.floor(longitudes/self.cellSize).astype(np.int64)
+      cellIDs = rows*(int(360/self.cellSize)+2) + columns
+      order = np.argsort(cellIDs, kind='stable')
+      uniqueIDs, starts = np.unique(cellIDs[order], return_index=True)
+      ends = np.append(starts[1:], len(order))
+      for cellID, start, end in zip(uniqueIDs, starts, ends):
+        cell = (int(rows[order[start]]), int(columns[order[start]]))
+        points = order[start:end]
+        for ix in self._cells.get(cell, []):
+          points = points[~inside[points]]
+          if not len(points): break
+          inside[points] |= self._includes(ix, latitudes[points], longitudes[points])
+    return inside
+
+  def includedBy(self, names, latitudes, longitudes):
+    '''
+    Returns a boolean matrix, True where a location (row) is in
+    a geography (column)
+    '''
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    matrix = np.zeros((len(latitudes), len(self.geographies)), dtype=bool)
+    if not len(matrix): return matrix
+
+    if self._names:
+      names = np.asarray(names, dtype=object)
+      for ix, geo in enumerate(self.geographies):
+        if geo._matchesName: matrix[:, ix] = names == geo.name
+
+    for ix in self._global:
+      matrix[:, ix] |= self._includes(ix, latitudes, longitudes)
+
+    if self._cells:
+      rows = np.floor(latitudes/self.cellSize).astype(np.int64)
+      columns = np.floor(longitudes/self.cellSize).astype(np.int64)
+      cellIDs = rows*(int(360/self.cellSize)+2) + columns
+      order = np.argsort(cellIDs, kind='stable')
+      uniqueIDs, starts = np.unique(cellIDs[order], return_index=True)
+      ends = np.append(starts[1:], len(order))
+      for cellID, start, end in zip(uniqueIDs, starts, ends):
+        cell = (int(rows[order[start]]), int(columns[order[start]]))
+        points = order[start:end]
+        for ix in self._cells.get(cell, []):
+          matrix[points, ix] |= self._includes(ix, latitudes[points], longitudes[points])
+    return matrix
+
+  def _includes(self, ix, latitudes, longitudes):
+    '''
+    Tests coordinates against a geography, bounding box first
+    '''
+    boxes = self._boxes[ix]
+    inBox = np.zeros(len(latitudes), dtype=bool)
+    for south, west, north, east in boxes:
+      inBox |= (latitudes >= south) & (latitudes <= north) & (longitudes >= west) & (longitudes <= east)
+    result = np.zeros(len(latitudes), dtype=bool)
+    if inBox.any():
+      result[inBox] = self.geographies[ix].includesMany(latitudes[inBox], longitudes[inBox])
+    return result
+
+  def _boxCells(self, box):
+    '''
+    Returns the grid cells overlapped by a bounding box
+    '''
+    south, west, north, east = box
+    rows = range(int(np.floor(south/self.cellSize)), int(np.floor(north/self.cellSize))+1)
+    columns = range(int(np.floor(west/self.cellSize)), int(np.floor(east/self.cellSize))+1)
+    return [(row, column) for row in rows for column in columns]
+
+  @staticmethod
+  def _splitBounds(bounds):
+    '''
+    Splits a bounding box crossing the antimeridian into boxes within [-180, 180]
+    '''
+    south, west, north, east = bounds
+    if west < -180:
+      return [(south, west+360, north, 180.0), (south, -180.0, north, east)]
+    if east > 180:
+      return [(south, west, north, 180.0), (south, -180.0, north, east-360)]
+    return [(south, west, north, east)]
@@ -1,5 +1,9 @@
+import numpy as np
 import geopy.distance
 
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi*EARTH_RADIUS_KM/180
+
 def distance(coord1, coord2):
   '''
   Calculates the distance between two lat-long coordinates
@@ -7,4 +11,14 @@ def distance(coord1, coord2):
 
   TODO: support other units
   '''
-  return geopy.distance.vincenty(coord1, coord2)
\ No newline at end of file
+  return geopy.distance.vincenty(coord1, coord2)
+
+def haversine(latitude, longitude, latitudes, longitudes):
+  '''
+  Calculates the great-circle distances in kilometers between a
+  lat-long coordinate and arrays of latitudes and longitudes
+  '''
+  lat1, lon1 = np.radians(latitude), np.radians(longitude)
+  lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+  a = np.sin((lat2-lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2-lon1)/2)**2
+  return 2*EARTH_RADIUS_KM*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
\ No newline at end of file
@@ -0,0 +1,194 @@
+import logging
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from DataCenter.Actor.Actor import Actor
+from DataCenter.Actor.ActorConnection import ActorConnection
+
+class ActorGraph():
+  '''
+  Defines an ActorGraph, which accumulates the actor graph updates
+  of an ingestion run in memory, and flushes them to MongoDB in bulk.
+
+  Actors are indexed by consecutive ints, reset on each flush. Pending
+  updates are kept as int-keyed dictionaries: actor -> articleIDs, and
+  (actor, actor) -> articleIDs for the edges, so updating the graph with
+  an article is a memory operation. Edges are flushed as upserts on their canonical
+  actor pair (see ActorConnection.upsertOperation).
+
+  Articles added with their date are also counted in daily buckets,
+  per actor and per edge (see Actor.bucketOperation and
+  ActorConnection.bucketOperation).
+
+  If an AnalyticsCache is given, the flushed edges are applied to it.
+  '''
+
+  def __init__(self, db, maxArticles=1000, analytics=None):
+    '''
+    Initializes an empty ActorGraph. full() is True once maxArticles
+    articles are pending.
+    '''
+    self._db = db
+    self.maxArticles = maxArticles
+    self.analytics = analytics
+    self.roundTrips = 0
+
+    # actor ObjectId <-> index
+    self._index = {}
+    self._ids = []
+
+    self._articleCount = 0
+    # index -> articleIDs
+    self._articles = {}
+    # (index, index), smallest first -> articleIDs
+    self._edges = {}
+    # (index, day) -> articleIDs
+    self._actorBuckets = {}
+    # (index, index, day) -> articleIDs
+    self._edgeBuckets = {}
+
+  def addArticle(self, articleID, actorIDs, dateString=None):
+    '''
+    Adds an article to its actors, and to the edges between them.
+    If its dateString (YYYYMMDDHHMMSS) is given, also adds it to
+    the buckets of its day.
+    '''
+    day = dateString[:8] if dateString else None
+    indices = [self._actorIndex(actorID) for actorID in actorIDs]
+    for ix in indices:
+      self._articles.setdefault(ix, []).append(articleID)
+      if day: self._actorBuckets.setdefault((ix, day), []).append(articleID)
+    for position, ix1 in enumerate(indices):
+      for ix2 in indices[position+1:]:
+        if ix1 == ix2: continue
+        key = (ix1, ix2) if ix1 < ix2 else (ix2, ix1)
+        self._edges.setdefault(key, []).append(articleID)
+        if day: self._edgeBuckets.setdefault((*key, day), []).append(articleID)
+    self._articleCount += 1
+
+  def discardArticles(self, articleIDs):
+    '''
+    Removes pending articles, e.g. articles which turned out
+    to be stored already (see BulkWriter.onExisting)
+    '''
+    articleIDs = set(articleIDs)
+    for pending in (self._articles, self._edges, self._actorBuckets, self._edgeBuckets):
+      for key in list(pending):
+        kept = [articleID for articleID in pending[key] if articleID not in articleIDs]
+        if kept:
+          pending[key] = kept
+        else:
+          del pending[key]
+    self._articleCount = max(0, self._articleCount - len(articleIDs))
+
+  def full(self):
+    '''
+    Returns True if maxArticles articles are pending
+    '''
+    return bool(self.maxArticles) and self._articleCount >= self.maxArticles
+
+  def pending(self):
+    '''
+    Returns the number of pending articles
+    '''
+    return self._articleCount
+
+  def flush(self):
+    '''
+    Writes the pending updates. The actors must already be stored.
+    Returns True if every write was acknowledged.
+    '''
+    articles, self._articles = self._articles, {}
+    edges, self._edges = self._edges, {}
+    actorBuckets, self._actorBuckets = self._actorBuckets, {}
+    edgeBuckets, self._edgeBuckets = self._edgeBuckets, {}
+    self._articleCount = 0
+
+    success = True
+    actorUpdates = [Actor.articleOperation(self._ids[ix], articleIDs)
+                    for ix, articleIDs in articles.items()]
+    if actorUpdates:
+      success &= bool(self._write(Actor._collectionKey, actorUpdates))
+    if edges:
+      success &= self._flushEdges(edges)
+    if actorBuckets:
+      success &= bool(self._write(Actor._bucketCollectionKey, [
+        Actor.bucketOperation(self._ids[ix], day, articleIDs)
+        for (ix, day), articleIDs in actorBuckets.items()]))
+    if edgeBuckets:
+      success &= bool(self._write(ActorConnection._bucketCollectionKey, [
+        ActorConnection.bucketOperation(self._ids[ix1], self._ids[ix2], day, articleIDs)
+        for (ix1, ix2, day), articleIDs in edgeBuckets.items()]))
+    if self.analytics is not None:
+      if success:
+        self.analytics.addEdges(self._edgeStrengths(edges, edgeBuckets))
+      else:
+        self.analytics.invalidate()
+
+    # nothing pending refers to the indices anymore
+    self._index = {}
+    self._ids = []
+    return success
+
+  def _edgeStrengths(self, edges, edgeBuckets):
+    '''
+    Returns the flushed edges as (actorA, actorB, day, strength),
+    day None for the articles added without their date
+    '''
+    strengths, dated = [], {}
+    for (ix1, ix2, day), articleIDs in edgeBuckets.items():
+      strengths.append((self._ids[ix1], self._ids[ix2], day, len(articleIDs)))
+      dated[(ix1, ix2)] = dated.get((ix1, ix2), 0) + len(articleIDs)
+    for (ix1, ix2), articleIDs in edges.items():
+      undated = len(articleIDs) - dated.get((ix1, ix2), 0)
+      if undated: strengths.append((self._ids[ix1], self._ids[ix2], None, undated))
+    return strengths
+
+  def _flushEdges(self, edges):
+    '''
+    Upserts the edges on their canonical actor pair with a single
+    bulk write, then links the connections it created from both actors
+    '''
+    keys = list(edges)
+    operations = [ActorConnection.upsertOperation(self._ids[ix1], self._ids[ix2], edges[(ix1, ix2)])
+                  for ix1, ix2 in keys]
+    result = self._write(ActorConnection._collectionKey, operations)
+    if not result: return False
+
+    actorUpdates = []
+    for position, connectionID in result.upserted_ids.items():
+      actorID1, actorID2 = (self._ids[ix] for ix in keys[position])
+      actorUpdates.append(UpdateOne({'_id': actorID1}, {
+        '$set': {f'connections.{str(actorID2)}': connectionID}
+      }))
+      actorUpdates.append(UpdateOne({'_id': actorID2}, {
+        '$set': {f'connections.{str(actorID1)}': connectionID}
+      }))
+    if not actorUpdates: return True
+    return bool(self._write(Actor._collectionKey, actorUpdates))
+
+  def _actorIndex(self, actorID):
+    '''
+    Returns the index of an actor, indexing it if it's new
+    '''
+    ix = self._index.get(actorID)
+    if ix is None:
+      ix = self._index[actorID] = len(self._ids)
+      self._ids.append(actorID)
+    return ix
+
+  def _write(self, collectionKey, operations):
+    '''
+    Runs an unordered bulk write on the collection.
+    Returns its result if acknowledged, None otherwise
+    '''
+    self.roundTrips += 1
+    try:
+      result = self._db[collectionKey].bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+      logging.error(f'ActorGraph: {collectionKey} bulk write failed: {e.details.get("writeErrors", [])[:1]}')
+      return None
+    if not result.acknowledged:
+      logging.error(f'ActorGraph: {collectionKey} bulk write not acknowledged')
+      return None
+    return result
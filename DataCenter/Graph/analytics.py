@@ -0,0 +1,281 @@
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix, coo_matrix
+
+from DataCenter.Actor.Actor import Actor
+from DataCenter.Graph.sparsegraph import SparseGraph
+from DataCenter.Utils.lru import LRUCache
+
+class GraphAnalytics():
+  '''
+  Defines GraphAnalytics on an actor graph, held as a symmetric
+  SciPy CSR matrix of connection strengths, with the actor ObjectIds
+  remapped to row indices.
+
+  Every measure is a vectorized operation on the matrix (sparse
+  matrix-vector products and grouped NumPy reductions), and is memoized
+  until edges are added (see addEdges).
+  '''
+
+  def __init__(self, graph):
+    '''
+    Initializes the GraphAnalytics from a SparseGraph
+    '''
+    self.actorIDs = list(graph.actorIDs)
+    self.names = list(graph.names)
+    self.index = {actorID: ix for ix, actorID in enumerate(self.actorIDs)}
+    n = len(self.actorIDs)
+    self.matrix = csr_matrix(coo_matrix((np.r_[graph.weights, graph.weights],
+                                         (np.r_[graph.sources, graph.targets], np.r_[graph.targets, graph.sources])),
+                                        shape=(n, n)))
+    self.version = 0
+    self._results = {}
+
+  def nodeCount(self):
+    return len(self.actorIDs)
+
+  def edgeCount(self):
+    return self.matrix.nnz // 2
+
+  def addEdges(self, edges, db=None):
+    '''
+    Adds strength to the connections of edges, a list of
+    (actorA, actorB, strength), indexing the new actors (and loading
+    their names from db if given). Clears the memoized measures.
+    '''
+    if not edges: return
+    newActors = []
+    rows, cols, weights = [], [], []
+    for actorA, actorB, strength in edges:
+      ixs = []
+      for actorID in (actorA, actorB):
+        ix = self.index.get(actorID)
+        if ix is None:
+          ix = self.index[actorID] = len(self.actorIDs)
+          self.actorIDs.append(actorID)
+          self.names.append(str(actorID))
+          newActors.append(ix)
+        ixs.append(ix)
+      if ixs[0] == ixs[1]: continue
+      rows += ixs
+      cols += ixs[::-1]
+      weights += [strength, strength]
+
+    n = self.nodeCount()
+    matrix = self.matrix
+    if newActors:
+      matrix = csr_matrix((matrix.data, matrix.indices, np.r_[matrix.indptr, np.repeat(matrix.indptr[-1], len(newActors))]),
+                          shape=(n, n))
+    self.matrix = matrix + csr_matrix((weights, (rows, cols)), shape=(n, n))
+    if db is not None and newActors: self._loadNames(db, newActors)
+    self.version += 1
+    self._results = {}
+
+  def _loadNames(self, db, indices):
+    actorIDs = [self.actorIDs[ix] for ix in indices]
+    for doc in db[Actor._collectionKey].find({'_id': {'$in': actorIDs}}, {'name': 1}):
+      if doc.get('name'): self.names[self.index[doc['_id']]] = doc['name']
+
+  def _memo(self, key, compute):
+    if key not in self._results: self._results[key] = compute()
+    return self._results[key]
+
+  def weightedDegree(self):
+    '''
+    Returns the weighted degree (summed connection strength) of each actor
+    '''
+    return self._memo(('weightedDegree',), lambda: np.asarray(self.matrix.sum(axis=1)).ravel())
+
+  def pageRank(self, damping=0.85, tolerance=1e-8, maxIterations=100):
+    '''
+    Returns the weighted PageRank of each actor, by power iteration
+    '''
+    def compute():
+      n = self.nodeCount()
+      if not n: return np.zeros(0)
+      degrees = self.weightedDegree()
+      dangling = degrees == 0
+      # transition matrix, transposed: column j spreads the rank of j
+      transition = (self.matrix.multiply(1/np.where(dangling, 1, degrees)[:, None])).T.tocsr()
+      ranks = np.full(n, 1/n)
+      for _ in range(maxIterations):
+        previous = ranks
+        ranks = damping*(transition @ ranks + ranks[dangling].sum()/n) + (1 - damping)/n
+        if np.abs(ranks - previous).sum() < tolerance: break
+      return ranks
+    return self._memo(('pageRank', damping, tolerance, maxIterations), compute)
+
+  def betweenness(self, samples=256, seed=0):
+    '''
+    Returns the (hop count) betweenness centrality of each actor, estimated
+    by Brandes' accumulation from samples random sources (exact if
+    samples >= the number of actors). Each BFS advances a whole level
+    with one sparse matrix-vector product.
+    '''
+    def compute():
+      n = self.nodeCount()
+      centrality = np.zeros(n)
+      if n < 3: return centrality
+      adjacency = (self.matrix > 0).astype(np.float64).tocsr()
+      if samples >= n:
+        sources = np.arange(n)
+      else:
+        sources = np.random.default_rng(seed).choice(n, samples, replace=False)
+      for source in sources:
+        centrality += GraphAnalytics._dependencies(adjacency, source)
+      # each path is counted from both ends
+      return centrality * n/len(sources) / 2
+    return self._memo(('betweenness', samples, seed), compute)
+
+  @staticmethod
+  def _dependencies(adjacency, source):
+    '''
+    Returns the dependencies of the actors on the shortest paths from source
+    '''
+    n = adjacency.shape[0]
+    depths = np.full(n, -1)
+    paths = np.zeros(n)
+    depths[source], paths[source] = 0, 1
+    levels = [np.array([source])]
+    while True:
+      frontier = np.zeros(n)
+      frontier[levels[-1]] = paths[levels[-1]]
+      reached = adjacency @ frontier
+      level = np.flatnonzero((reached > 0) & (depths < 0))
+      if not len(level): break
+      depths[level] = len(levels)
+      paths[level] = reached[level]
+      levels.append(level)
+
+    dependencies = np.zeros(n)
+    for depth in range(len(levels) - 1, 0, -1):
+      level, parents = levels[depth], levels[depth-1]
+      weights = np.zeros(n)
+      weights[level] = (1 + dependencies[level]) / paths[level]
+      dependencies[parents] += paths[parents] * (adjacency @ weights)[parents]
+    dependencies[source] = 0
+    return dependencies
+
+  def communities(self, maxIterations=50, seed=0):
+    '''
+    Returns the community of each actor (0 for the largest community),
+    by weighted label propagation: each iteration, a random half of the
+    actors adopt the label of strongest connection among their neighbours
+    '''
+    def compute():
+      n = self.nodeCount()
+      labels = np.arange(n)
+      if not n: return labels
+      rng = np.random.default_rng(seed)
+      edges = self.matrix.tocoo()
+      for _ in range(maxIterations):
+        # summed strength per (actor, neighbour label)
+        keys, inverse = np.unique(edges.row.astype(np.int64)*n + labels[edges.col], return_inverse=True)
+        strengths = np.bincount(inverse.ravel(), edges.data)
+        actors, candidates = keys // n, keys % n
+        # strongest label per actor, keeping the current label on ties
+        current = candidates == labels[actors]
+        order = np.lexsort((rng.random(len(keys)), ~current, -strengths, actors))
+        first = order[np.r_[True, actors[order][1:] != actors[order][:-1]]]
+        proposed = labels.copy()
+        proposed[actors[first]] = candidates[first]
+        update = rng.random(n) < 0.5
+        if (proposed == labels).all(): break
+        labels = np.where(update, proposed, labels)
+      # renumber by community size
+      _, labels, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+      rank = np.empty(len(sizes), dtype=np.int64)
+      rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+      return rank[labels.ravel()]
+    return self._memo(('communities', maxIterations, seed), compute)
+
+  def neighborhood(self, actorID, k=1):
+    '''
+    Returns the indices of the actors within k hops of an actor
+    '''
+    n = self.nodeCount()
+    reached = np.zeros(n, dtype=bool)
+    reached[self.index[actorID]] = True
+    frontier = reached.copy()
+    for _ in range(k):
+      frontier = (self.matrix @ frontier.astype(np.float64) > 0) & ~reached
+      if not frontier.any(): break
+      reached |= frontier
+    return np.flatnonzero(reached)
+
+  def egoNetwork(self, actorID, k=1):
+    '''
+    Returns the SparseGraph of the actors within k hops of an actor,
+    and the connections between them
+    '''
+    indices = self.neighborhood(actorID, k)
+    edges = self.matrix[indices][:, indices].tocoo()
+    upper = edges.row < edges.col
+    return SparseGraph([self.actorIDs[ix] for ix in indices], edges.row[upper], edges.col[upper],
+                       edges.data[upper], [self.names[ix] for ix in indices])
+
+  def top(self, scores, count=10):
+    '''
+    Returns the count actors of highest score, as (actorID, name, score)
+    '''
+    order = np.argsort(-scores, kind='stable')[:count]
+    return [(self.actorIDs[ix], self.names[ix], float(scores[ix])) for ix in order]
+
+class AnalyticsCache():
+  '''
+  Defines an AnalyticsCache, which keeps the GraphAnalytics of the
+  latest (query, date window, minStrength) requested, at most maxSize.
+
+  Edges added by ingestion are applied to the cached graphs whose
+  window includes their day (see addEdges), rather than reloading them.
+  '''
+
+  def __init__(self, db, maxSize=16):
+    '''
+    Initializes an empty AnalyticsCache on db
+    '''
+    self._db = db
+    self._entries = LRUCache(maxSize)
+
+  def get(self, startDay=None, endDay=None, minStrength=1, queryKey=None):
+    '''
+    Returns the GraphAnalytics of the connections of strength >= minStrength,
+    counted from startDay (included) to endDay (excluded), both YYYYMMDD,
+    loading it if it isn't cached
+    '''
+    key = (queryKey, startDay, endDay, minStrength)
+    analytics = self._entries.get(key)
+    if analytics is None:
+      analytics = GraphAnalytics(SparseGraph.fromDB(self._db, minStrength, startDay, endDay))
+      self._entries.put(key, analytics)
+    return analytics
+
+  def addEdges(self, edges):
+    '''
+    Applies edges, a list of (actorA, actorB, day, strength), to the cached
+    graphs: to those without a window, and to the windows including day
+    (edges without a day only count without a window). Graphs with a
+    minStrength above 1 are dropped, as edges may cross their threshold.
+    '''
+    if not edges: return
+    for key, analytics in self._entries.items():
+      queryKey, startDay, endDay, minStrength = key
+      if minStrength > 1:
+        self._entries.pop(key)
+        continue
+      if startDay is None and endDay is None:
+        added = [(actorA, actorB, strength) for actorA, actorB, day, strength in edges]
+      else:
+        added = [(actorA, actorB, strength) for actorA, actorB, day, strength in edges
+                 if day and (startDay is None or day >= startDay) and (endDay is None or day < endDay)]
+      analytics.addEdges(added, self._db)
+    logging.log(1, f'AnalyticsCache.addEdges: {len(edges)} edges')
+
+  def invalidate(self):
+    '''
+    Drops every cached graph
+    '''
+    self._entries.clear()
+
+  def stats(self):
+    return self._entries.stats()
@@ -1,5 +1,6 @@
 import logging
-from metaphone import doublemetaphone
+import pandas as pd
+import numpy as np
 
 from DataCenter.Article.Article import Article
 from DataCenter.Actor.Actor import Actor
@@ -8,73 +9,281 @@ from DataCenter.Geo.GDeltLocation import GDeltLocation
 TYPE_ORGANIZATION = 'organization'
 TYPE_PERSON = 'person'
 
-def extractAndFilterData(data, dateString, query, db):
+# GKG columns used by extraction
+EXTRACTION_COLUMNS = ['DocumentIdentifier', 'Themes', 'Locations', 'Persons', 'Organizations']
+
+def extractAndFilterData(data, dateString, query, db, writer=None, actorCache=None, locationCache=None,
+                         articleCache=None, parseArticles=True):
   '''
   Extracts the url, people, organizations, and location from
   one row in the GKG dataframe
   '''
+  extracted = extractRowData(data)
+  if not extracted:
+    return False
+
+  (peopleNames, orgNames, locations, gkgThemes) = extracted
+
+  if query and not query.filterArticle(locations, peopleNames+orgNames, gkgThemes): return False
+
+  url = str(data['DocumentIdentifier'])
+  return storeData(url, dateString, peopleNames, orgNames, locations, db, writer, actorCache,
+                   locationCache=locationCache, articleCache=articleCache, parseArticles=parseArticles)
+
+def extractAndStoreData(data, dateString, db, writer=None, actorCache=None, locationCache=None, articleCache=None,
+                        parseArticles=True):
+  '''
+  Extracts and stores one row of the GKG dataframe which
+  has already passed the query filters (see extractAndFilterFrame)
+  '''
+  extracted = extractRowData(data)
+  if not extracted:
+    return False
+
+  (peopleNames, orgNames, locations, gkgThemes) = extracted
+  url = str(data['DocumentIdentifier'])
+  return storeData(url, dateString, peopleNames, orgNames, locations, db, writer, actorCache,
+                   locationCache=locationCache, articleCache=articleCache, parseArticles=parseArticles)
+
+def extractRowData(data):
+  '''
+  Extracts the people, organizations, locations and themes from
+  one row in the GKG dataframe. Returns False if the row has no actors
+  or no locations.
+  '''
   peopleNames = extractDataList('Persons', data)
   orgNames = extractDataList('Organizations', data)
-  
-  actorNames = peopleNames+orgNames
-  if not len(actorNames):
+
+  if not len(peopleNames+orgNames):
     return False
 
+  # rows without locations are never stored
   locations = extractLocations(data)
+  if locations is None:
+    return False
 
   gkgThemes = set(extractDataList('Themes', data))
 
-  if query and not query.filterArticle(locations, actorNames, gkgThemes): return False
+  return peopleNames, orgNames, locations, gkgThemes
 
-  locationIDs = [loc.storeDB(db) for loc in locations]
+def storeData(url, dateString, peopleNames, orgNames, locations, db, writer=None, actorCache=None, actorKeys=None,
+              locationCache=None, articleCache=None, parseArticles=True):
+  '''
+  Stores the locations, actors and article of an extracted row.
+  If a BulkWriter is given, the inserts are queued on it.
+  If an ActorCache is given, actors are resolved through it.
+  actorKeys optionally maps actor names to their precomputed DoubleMetaphone codes.
+  If an LRUCache is given as locationCache, location ObjectIds are interned in it.
+  If an LRUCache is given as articleCache, articles whose urlHash is in it are skipped.
+  If parseArticles is False, articles are stored unparsed, to be enriched later.
+  Returns False if the article was already stored.
+  '''
+  if articleCache is not None and articleCache.get(Article.hashURL(url)) is not None:
+    return False
 
-  peopleIDs = extractActorIDs(TYPE_PERSON, peopleNames, db)
-  orgIDs = extractActorIDs(TYPE_PERSON, orgNames, db)
-  actorIDs = peopleIDs+orgIDs
+  locationIDs = extractLocationIDs(locations, db, locationCache, writer)
 
-  url = str(data['DocumentIdentifier'])
-  articleID = extractArticleID(url, dateString, actorIDs, peopleIDs, orgIDs, locationIDs, db)
+  peopleIDs = extractActorIDs(TYPE_PERSON, peopleNames, db, writer, actorCache, actorKeys)
+  orgIDs = extractActorIDs(TYPE_ORGANIZATION, orgNames, db, writer, actorCache, actorKeys)
+  # names resolving to the same actor count once
+  actorIDs = list(dict.fromkeys(peopleIDs+orgIDs))
+
+  articleID = extractArticleID(url, dateString, actorIDs, peopleIDs, orgIDs, locationIDs, db, writer, articleCache,
+                               parseArticles)
+  if articleID is None: return False
 
   return articleID, actorIDs, locationIDs
 
+def extractAndFilterFrame(df, query):
+  '''
+  Columnar counterpart of extractAndFilterData. Splits the semicolon
+  delimited columns of the whole GKG dataframe at once, applies the
+  query filters as boolean masks, and returns only the surviving rows.
+  '''
+  people = explodeDataList('Persons', df)
+  orgs = explodeDataList('Organizations', df)
+  actorNames = pd.concat([people, orgs])
+
+  locations, validLocations = extractLocationFrame(df)
+  themes = explodeDataList('Themes', df)
+
+  mask = _rowMask(actorNames.groupby(level=0).size() > 0, df.index, False)
+  mask &= _rowMask(validLocations, df.index, False)
+
+  if query:
+    mask &= _rowMask(query.locationMask(locations), df.index, False)
+    mask &= _rowMask(query.actorMask(actorNames), df.index, False)
+    mask &= _rowMask(query.themeMask(themes), df.index, False)
+
+  return df[mask]
+
+def filterFrameMany(df, querySet):
+  '''
+  Multi-query counterpart of extractAndFilterFrame. Splits the columns
+  of the GKG dataframe once, and returns a boolean DataFrame (row x query)
+  of the rows relevant to each query of the QuerySet.
+  '''
+  people = explodeDataList('Persons', df)
+  orgs = explodeDataList('Organizations', df)
+  actorNames = pd.concat([people, orgs])
+
+  locations, validLocations = extractLocationFrame(df)
+  themes = explodeDataList('Themes', df)
+
+  mask = _rowMask(actorNames.groupby(level=0).size() > 0, df.index, False)
+  mask &= _rowMask(validLocations, df.index, False)
+
+  relevant = pd.DataFrame(np.repeat(mask.values[:, None], len(querySet), axis=1), index=df.index)
+  for partial in (querySet.locationMask(locations), querySet.actorMask(actorNames), querySet.themeMask(themes)):
+    relevant &= partial.reindex(df.index, fill_value=False).astype(bool)
+  return relevant
+
+def explodeDataList(fieldName, df):
+  '''
+  Splits a semicolon delimited column into a Series of values,
+  indexed by the row they came from
+  '''
+  exploded = df[fieldName].dropna().astype(str).str.split(';').explode()
+  return exploded[exploded.notna() & (exploded != 'nan')]
+
+def extractLocationFrame(df):
+  '''
+  Extracts the locations of every row in df. Returns a DataFrame of
+  (type, name, latitude, longitude) indexed by row, and a boolean Series
+  marking the rows whose locations all parsed. Each distinct raw location
+  string is only parsed once.
+  '''
+  raw = explodeDataList('Locations', df)
+  parsed = {}
+  for loc in raw.unique():
+    try:
+      parsed[loc] = rawToGDeltLocation(loc.split('#'))
+    except (IndexError, KeyError, ValueError):
+      parsed[loc] = None
+
+  locs = [parsed[loc] for loc in raw]
+  valid = pd.Series([loc is not None for loc in locs], index=raw.index)
+  locations = pd.DataFrame({
+    'type': [loc.type for loc in locs if loc],
+    'name': [loc.name for loc in locs if loc],
+    'latitude': [loc.latitude for loc in locs if loc],
+    'longitude': [loc.longitude for loc in locs if loc]
+  }, index=raw.index[valid.values])
+  return locations, valid.groupby(level=0).all()
+
+def _rowMask(partial, index, default):
+  '''
+  Aligns a per-row boolean Series to the dataframe index
+  '''
+  return partial.reindex(index, fill_value=default).astype(bool)
+
 def extractDataList(fieldName, data):
   '''
   extracts list from fieldNames
   '''
+  if pd.isna(data[fieldName]): return []
   return list(filter(lambda x: x!= 'nan', str(data[fieldName]).split(';')))
 
-def extractActorIDs(actorType, actorNames, db):
+def extractActorIDs(actorType, actorNames, db, writer=None, actorCache=None, actorKeys=None):
   '''
   Queries the database to find actors that have similar metaphone names
   If there are more than one, uses the highest fuzzy score
   '''
-  return [extractActorID(actorType, a, db) for a in actorNames]
+  actorKeys = actorKeys or {}
+  return [extractActorID(actorType, a, db, writer, actorCache, actorKeys.get(a)) for a in actorNames]
 
-def extractActorID(actorType, actorName, db):
+def extractActorID(actorType, actorName, db, writer=None, actorCache=None, codes=None):
   '''
   Queries the database to find actors that have similar metaphone names
   If there are more than one, uses the highest fuzzy score
   '''
+  codes = codes or Actor.phoneticKeys(actorName)
+  if actorCache is not None:
+    actorID = actorCache.lookup(actorType, actorName, codes)
+    if actorID: return actorID
+
   collection = db[Actor._collectionKey]
-  meta = doublemetaphone(actorName)
-  _a_name = actorName[0] + actorName[1]
-  query = {'_a_name': _a_name}
-  result = collection.find_one(query)
-  
-  if result:
-    print('findone result: ', result)
-    return result['_id']
-  logging.log(3, 'extraction.extractActorID: created new actor')
-  # creates a new Actor
-  actorID = Actor(actorType, actorName, db=db)._mongoID
+  query = {'actorType': actorType, '_a_keys': {'$in': codes}}
+  candidates = [(c['_id'], c['name']) for c in collection.find(query, {'name': 1})]
+  # actors queued on the writer are not in the database yet
+  if writer:
+    pending = writer.findPending(Actor._collectionKey, [(actorType, code) for code in codes], _pendingActorKeys)
+    candidates += [(doc['_id'], doc['name']) for doc in pending]
+
+  actorID = Actor.bestMatch(actorName, candidates)
+  if not actorID:
+    logging.log(3, 'extraction.extractActorID: created new actor')
+    # creates a new Actor
+    actorID = Actor(actorType, actorName, db=db, writer=writer)._mongoID
+    candidates.append((actorID, actorName))
+
+  if actorCache is not None:
+    for candidateID, candidateName in candidates:
+      actorCache.add(actorType, candidateName, candidateID, codes if candidateName == actorName else None)
   return actorID
 
+def _pendingActorKeys(doc):
+  '''
+  Returns the keys of a queued actor, (actorType, code) for each of its codes
+  '''
+  return [(doc['actorType'], code) for code in doc['_a_keys']]
+
+def extractLocationIDs(locations, db, locationCache=None, writer=None):
+  '''
+  Returns the ObjectIds of the locations. Each distinct location is
+  stored once (see Location.upsertDB), and looked up in locationCache
+  by its identity afterwards. If a BulkWriter is given, the upserts
+  of the locations missing from locationCache are queued on it.
+  '''
+  locationIDs = []
+  for loc in locations:
+    key = tuple(loc.identity().values())
+    locationID = locationCache.get(key) if locationCache is not None else None
+    if locationID is None:
+      locationID = loc.upsertDB(db, writer)
+      if locationCache is not None: locationCache.put(key, locationID)
+    locationIDs.append(locationID)
+  return locationIDs
+
+def cacheLocationIDs(locations, db, locationCache, batchSize=10000):
+  '''
+  Puts the ObjectIds of the stored locations among locations (GDeltLocations)
+  which aren't in locationCache yet in it, so that only the upserts of new
+  locations are queued (see extractLocationIDs). The locations are looked up
+  by name, batchSize names per query.
+  '''
+  missing = {}
+  for loc in locations:
+    identity = loc.identity()
+    key = tuple(identity.values())
+    if key not in missing and locationCache.peek(key) is None: missing[key] = identity
+  if not missing: return
+  fields = list(next(iter(missing.values())))
+  names = list({identity['name'] for identity in missing.values()})
+  for start in range(0, len(names), batchSize):
+    query = {'name': {'$in': names[start:start+batchSize]}}
+    for doc in db[GDeltLocation._collection].find(query, {field: 1 for field in fields}):
+      key = tuple(doc.get(field) for field in fields)
+      if key in missing: locationCache.put(key, doc['_id'])
+
+def extractFrameLocations(df):
+  '''
+  Returns the distinct GDeltLocations of the rows of df which parse
+  '''
+  locations = []
+  for loc in explodeDataList('Locations', df).unique():
+    try:
+      locations.append(rawToGDeltLocation(loc.split('#')))
+    except (IndexError, KeyError, ValueError):
+      continue
+  return locations
+
 def extractLocations(data):
   '''
   Exracts locations from a row in data
   '''
   locationStr = str(data['Locations'])
-  if locationStr == 'nan':
+  if pd.isna(data['Locations']) or locationStr == 'nan':
     return None
   else:
     location_infos = [location.split('#') for location in locationStr.split(';')]
@@ -88,9 +297,36 @@ def rawToGDeltLocation(loc):
   loc_type, name, latitude, longitude = loc[0], loc[1], float(loc[4]), float(loc[5])
   return GDeltLocation(type=loc_type, name=name, latitude=latitude, longitude=longitude)
 
-def extractArticleID(url, dateString, actorIDs, peopleIDs, orgIDs, locationIDs, db):
+def extractArticleID(url, dateString, actorIDs, peopleIDs, orgIDs, locationIDs, db, writer=None, articleCache=None,
+                     parse=True):
   '''
   Creates a new Article class with the relevant
-  people, organizations, and locations
+  people, organizations, and locations.
+  Returns None if the article was already stored.
+  '''
+  article = Article(url, dateString, actorIDs, peopleIDs, orgIDs, locationIDs, db=db, writer=writer, parse=parse)
+  if articleCache is not None: articleCache.put(article.urlHash, article._mongoID)
+  return article._mongoID if article.inserted else None
+
+def knownArticleMask(urls, db, articleCache=None, batchSize=10000):
+  '''
+  Returns a boolean Series, True for each of urls whose article is
+  already stored. urls are looked up in articleCache first, and the
+  others in the article collection, batchSize hashes per query.
   '''
-  return Article(url, dateString, actorIDs, peopleIDs, orgIDs, locationIDs, db=db)._mongoID
\ No newline at end of file
+  hashes = urls.astype(str).map(Article.hashURL)
+  if articleCache is not None:
+    known = hashes.map(lambda urlHash: articleCache.peek(urlHash) is not None).astype(bool)
+  else:
+    known = pd.Series(False, index=urls.index)
+
+  missing = hashes[~known].unique()
+  stored = {}
+  for start in range(0, len(missing), batchSize):
+    batch = list(missing[start:start+batchSize])
+    for doc in db[Article._collectionKey].find({'urlHash': {'$in': batch}}, {'urlHash': 1}):
+      stored[doc['urlHash']] = doc['_id']
+  if articleCache is not None:
+    for urlHash, articleID in stored.items():
+      articleCache.put(urlHash, articleID)
+  return known | hashes.isin(stored)
\ No newline at end of file
@@ -1,62 +1,58 @@
 import pandas as pd
 import numpy as np
-import pygraphviz as pgv
-import matplotlib.pyplot as plt
 import logging
 
 from DataCenter.Actor.ActorConnection import ActorConnection
 from DataCenter.Actor.Actor import Actor
+from DataCenter.Graph.actorgraph import ActorGraph
 
-def updateGraph(articleID, actorIDs, db):
+def updateGraph(articleID, actorIDs, db, actorGraph=None, dateString=None):
   '''
-  updates actor graphs to include new articles
-  returns updateActors and newActors, which represent
-  items to update and create, respectively
+  Updates the actor graph to include a new article: adds it to its
+  actors, and to the edges between them. If the dateString of the
+  article is given, it is also counted in the daily buckets.
+
+  If an ActorGraph is given, the updates are accumulated in it
+  and written when it is flushed. Otherwise, they are written
+  right away, with the same bulk operations.
   '''
   logging.log(1, 'updateGraph')
 
-  # updates actors with new articles
-  if not addArticleToActors(articleID, actorIDs, db): return False
-
-  # update edges
-  if not updateActorEdges(articleID, actorIDs, db): return False
+  if actorGraph is None:
+    actorGraph = ActorGraph(db, None)
+    actorGraph.addArticle(articleID, actorIDs, dateString)
+    return actorGraph.flush()
 
+  actorGraph.addArticle(articleID, actorIDs, dateString)
   return True
 
-def addArticleToActors(articleID, actorIDs, db):
+def getConnectionStrengths(db, startDay, endDay, minStrength=1):
   '''
-  Adds the article to the existing graph
-  If the name is not currently within the graph, creates a new object
+  Returns the strength of the connections over the days
+  startDay (included) to endDay (excluded), both YYYYMMDD,
+  as a list of (actorA, actorB, strength), strongest first.
+  For a weekly strength, endDay is 7 days after startDay.
   '''
-  logging.log(2, 'addArticleToActors')
-  for a in actorIDs:
-    query = {'_id': a}
-    actor = db.actor.find_one(query)
-    if not actor:
-      logging.error('Actor does not exist.')
-      return False
-    result = db[Actor._collectionKey].update_one(query, {
-      '$push': { 'articleIDs': articleID }
-    })
-    if not result.acknowledged:
-      logging.error('graph.addArticleToActors: push not acknowledged')
-      return False
-  return True
+  pipeline = [
+    {'$match': {'day': {'$gte': startDay, '$lt': endDay}}},
+    {'$group': {'_id': {'actorA': '$actorA', 'actorB': '$actorB'}, 'strength': {'$sum': '$strength'}}},
+    {'$match': {'strength': {'$gte': minStrength}}},
+    {'$sort': {'strength': -1}}
+  ]
+  return [(doc['_id']['actorA'], doc['_id']['actorB'], doc['strength'])
+          for doc in db[ActorConnection._bucketCollectionKey].aggregate(pipeline)]
 
-def updateActorEdges(articleID, actorIDs, db):
+def getActorStrengths(db, startDay, endDay, minStrength=1):
   '''
-  Creates all edges between actors in the url
+  Returns the number of articles of each actor over the days
+  startDay (included) to endDay (excluded), both YYYYMMDD,
+  as a list of (actorID, strength), strongest first
   '''
-  logging.log(2, 'updateActorEdges')
-  if not len(actorIDs) or len(actorIDs)==1: return True
-  for ix, a1 in enumerate(actorIDs):
-    for a2 in actorIDs[ix+1:]:
-      query1, query2 = {'_id': a1}, {'_id': a2}
-      actor1Obj, actor2Obj = db.actor.find_one(query1), db.actor.find_one(query2)
-      if not actor1Obj or not actor2Obj:
-        logging.error('graph.updateActorEdges: one of the actors was not found')
-        return False
-      actor1Obj['_db'], actor2Obj['_db'] = db, db
-      actor1, actor2 = Actor.fromDB(actor1Obj), Actor.fromDB(actor2Obj)
-      if not actor1.updateOrCreateConnection(actor2, articleID): return False
-  return True
\ No newline at end of file
+  pipeline = [
+    {'$match': {'day': {'$gte': startDay, '$lt': endDay}}},
+    {'$group': {'_id': '$actorID', 'strength': {'$sum': '$strength'}}},
+    {'$match': {'strength': {'$gte': minStrength}}},
+    {'$sort': {'strength': -1}}
+  ]
+  return [(doc['_id'], doc['strength'])
+          for doc in db[Actor._bucketCollectionKey].aggregate(pipeline)]
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from DataCenter.Actor.Actor import Actor
+from DataCenter.Graph.extraction import extractAndFilterFrame, extractRowData, EXTRACTION_COLUMNS
+
+# query of the worker process, set by _initWorker
+_workerQuery = None
+
+class ParallelExtractor():
+  '''
+  Defines a ParallelExtractor, which shards GKG dataframes across
+  a pool of worker processes. Workers filter their shard with the
+  query and extract the relevant rows, and return compact results
+  to be persisted by a single writer in the parent process.
+  '''
+
+  def __init__(self, query, workers=None, shardsPerWorker=4):
+    '''
+    Initializes the pool of workers processes (the number of CPUs
+    by default). The query is sent once to each worker.
+    '''
+    self.workers = workers or os.cpu_count() or 1
+    self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_initWorker, initargs=(query,))
+    self.shardCount = self.workers * shardsPerWorker
+
+  def extract(self, df, filtered=False):
+    '''
+    Filters and extracts df on the worker processes. Yields, in row order,
+    (url, peopleNames, orgNames, locations, actorKeys) for each relevant row,
+    where actorKeys maps each actor name to its DoubleMetaphone codes.
+    If filtered is True, the rows have already passed the query filters.
+    '''
+    df = df[EXTRACTION_COLUMNS]
+    shards = [df.iloc[ix] for ix in np.array_split(np.arange(len(df)), self.shardCount) if len(ix)]
+    for future in [self._executor.submit(extractShard, shard, filtered) for shard in shards]:
+      yield from future.result()
+
+  def close(self):
+    '''
+    Shuts the worker processes down
+    '''
+    self._executor.shutdown()
+
+def _initWorker(query):
+  global _workerQuery
+  _workerQuery = query
+
+def extractShard(df, filtered=False):
+  '''
+  Runs in a worker process. Filters a shard of the GKG dataframe (unless
+  filtered) and extracts the relevant rows (see ParallelExtractor.extract)
+  '''
+  results = []
+  rows = df if filtered else extractAndFilterFrame(df, _workerQuery)
+  for ix, data in rows.iterrows():
+    extracted = extractRowData(data)
+    if not extracted: continue
+    (peopleNames, orgNames, locations, gkgThemes) = extracted
+    actorKeys = {name: Actor.phoneticKeys(name) for name in set(peopleNames+orgNames)}
+    results.append((str(data['DocumentIdentifier']), peopleNames, orgNames, locations, actorKeys))
+  return results
@@ -0,0 +1,281 @@
+import logging
+from array import array
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+
+from DataCenter.Actor.Actor import Actor
+from DataCenter.Actor.ActorConnection import ActorConnection
+
+try:
+  from scipy.sparse import coo_matrix, diags
+  from scipy.sparse.csgraph import connected_components
+  from scipy.sparse.linalg import eigsh
+except ImportError:
+  coo_matrix = None
+
+class SparseGraph():
+  '''
+  Defines a SparseGraph, a compact in-memory copy of the actor graph:
+  actors are remapped to consecutive ints, and the edges are kept as
+  three arrays (sources, targets, weights), with sources < targets.
+
+  A SparseGraph is materialized from the actor_connection collection
+  (or from its daily buckets, for a time window) by streaming only the
+  actor pairs and strengths, so its memory grows with the number of
+  kept edges, not with the size of the connection documents.
+  '''
+
+  def __init__(self, actorIDs, sources, targets, weights, names=None, actorTypes=None):
+    '''
+    Initializes the SparseGraph from its actors (ObjectIds, by index)
+    and its edge arrays
+    '''
+    self.actorIDs = actorIDs
+    self.sources = np.asarray(sources, dtype=np.int32)
+    self.targets = np.asarray(targets, dtype=np.int32)
+    self.weights = np.asarray(weights, dtype=np.float64)
+    self.names = names if names is not None else [str(actorID) for actorID in actorIDs]
+    self.actorTypes = actorTypes if actorTypes is not None else [None for _ in actorIDs]
+
+  @staticmethod
+  def fromDB(db, minStrength=1, startDay=None, endDay=None, topK=None, batchSize=10000):
+    '''
+    Materializes the actor graph of db. Keeps the connections of
+    strength >= minStrength, counting only the days startDay (included)
+    to endDay (excluded), both YYYYMMDD, if either is given.
+    If topK is set, keeps only the topK strongest connections of each
+    actor (a connection is kept if it is in the topK of either actor).
+    '''
+    index, actorIDs = {}, []
+    sources, targets, weights = array('i'), array('i'), array('d')
+
+    def actorIndex(actorID):
+      ix = index.get(actorID)
+      if ix is None:
+        ix = index[actorID] = len(actorIDs)
+        actorIDs.append(actorID)
+      return ix
+
+    for actorA, actorB, strength in SparseGraph._streamEdges(db, minStrength, startDay, endDay, batchSize):
+      ixA, ixB = actorIndex(actorA), actorIndex(actorB)
+      if ixA == ixB: continue
+      sources.append(min(ixA, ixB))
+      targets.append(max(ixA, ixB))
+      weights.append(strength)
+
+    graph = SparseGraph(actorIDs, np.frombuffer(sources, dtype=np.int32),
+                        np.frombuffer(targets, dtype=np.int32), np.frombuffer(weights, dtype=np.float64))
+    if topK: graph = graph.prune(topK)
+    graph._loadActors(db, batchSize)
+    logging.info(f'SparseGraph.fromDB: {graph.nodeCount()} actors, {graph.edgeCount()} connections')
+    return graph
+
+  @staticmethod
+  def _streamEdges(db, minStrength, startDay, endDay, batchSize):
+    '''
+    Yields (actorA, actorB, strength) for the connections of strength
+    >= minStrength, from the buckets of the window if one is given
+    '''
+    if startDay or endDay:
+      window = {}
+      if startDay: window['$gte'] = startDay
+      if endDay: window['$lt'] = endDay
+      pipeline = [
+        {'$match': {'day': window}},
+        {'$group': {'_id': {'actorA': '$actorA', 'actorB': '$actorB'}, 'strength': {'$sum': '$strength'}}},
+        {'$match': {'strength': {'$gte': minStrength}}}
+      ]
+      cursor = db[ActorConnection._bucketCollectionKey].aggregate(pipeline, allowDiskUse=True, batchSize=batchSize)
+      for doc in cursor:
+        yield doc['_id']['actorA'], doc['_id']['actorB'], doc['strength']
+      return
+
+    cursor = db[ActorConnection._collectionKey].find(
+      {'strength': {'$gte': minStrength}},
+      {'_id': 0, 'actorA': 1, 'actorB': 1, 'actorIDs': 1, 'strength': 1}
+    ).batch_size(batchSize)
+    for doc in cursor:
+      # connections stored before the canonical pair only have actorIDs
+      if 'actorA' in doc:
+        yield doc['actorA'], doc['actorB'], doc['strength']
+      elif len(doc.get('actorIDs') or []) == 2:
+        yield doc['actorIDs'][0], doc['actorIDs'][1], doc['strength']
+
+  def _loadActors(self, db, batchSize):
+    '''
+    Loads the names and types of the actors, batchSize at a time
+    '''
+    names, actorTypes = {}, {}
+    for start in range(0, len(self.actorIDs), batchSize):
+      batch = self.actorIDs[start:start+batchSize]
+      for doc in db[Actor._collectionKey].find({'_id': {'$in': batch}}, {'name': 1, 'actorType': 1}):
+        names[doc['_id']] = doc.get('name')
+        actorTypes[doc['_id']] = doc.get('actorType')
+    self.names = [names.get(actorID) or str(actorID) for actorID in self.actorIDs]
+    self.actorTypes = [actorTypes.get(actorID) for actorID in self.actorIDs]
+
+  def nodeCount(self):
+    return len(self.actorIDs)
+
+  def edgeCount(self):
+    return len(self.weights)
+
+  def prune(self, topK):
+    '''
+    Returns the SparseGraph keeping the topK strongest connections of
+    each actor, and only the actors with a connection left
+    '''
+    edgeCount = self.edgeCount()
+    # each edge once per actor, ordered by actor, strongest first
+    actors = np.r_[self.sources, self.targets]
+    edges = np.r_[np.arange(edgeCount), np.arange(edgeCount)]
+    order = np.lexsort((-self.weights[edges], actors))
+    ordered = actors[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    keep = np.zeros(edgeCount, dtype=bool)
+    keep[edges[order[ranks < topK]]] = True
+    return self._subgraph(keep)
+
+  def _subgraph(self, keep):
+    '''
+    Returns the SparseGraph of the kept edges, reindexing the actors
+    '''
+    sources, targets = self.sources[keep], self.targets[keep]
+    used = np.unique(np.concatenate([sources, targets]))
+    remap = np.full(self.nodeCount(), -1, dtype=np.int32)
+    remap[used] = np.arange(len(used), dtype=np.int32)
+    return SparseGraph([self.actorIDs[ix] for ix in used], remap[sources], remap[targets],
+                       self.weights[keep], [self.names[ix] for ix in used],
+                       [self.actorTypes[ix] for ix in used])
+
+  def export(self, path, format=None):
+    '''
+    Writes the graph to path as GraphML or GEXF, from format or
+    the extension of path ('.graphml' or '.gexf'). Nodes and edges are
+    written one at a time.
+    '''
+    format = (format or path.rsplit('.', 1)[-1]).lower()
+    if format == 'graphml':
+      writer = self._writeGraphML
+    elif format == 'gexf':
+      writer = self._writeGEXF
+    else:
+      raise ValueError(f'SparseGraph.export: unsupported format {format}')
+    with open(path, 'w', encoding='utf-8') as f:
+      writer(f)
+    logging.info(f'SparseGraph.export: {self.nodeCount()} actors, {self.edgeCount()} connections to {path}')
+    return path
+
+  def _writeGraphML(self, f):
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '<key id="name" for="node" attr.name="name" attr.type="string"/>\n'
+            '<key id="actorType" for="node" attr.name="actorType" attr.type="string"/>\n'
+            '<key id="weight" for="edge" attr.name="weight" attr.type="double"/>\n'
+            '<graph id="actors" edgedefault="undirected">\n')
+    for actorID, name, actorType in zip(self.actorIDs, self.names, self.actorTypes):
+      f.write(f'<node id="{actorID}"><data key="name">{escape(str(name))}</data>'
+              f'<data key="actorType">{escape(actorType or "")}</data></node>\n')
+    for ix, (source, target, weight) in enumerate(zip(self.sources, self.targets, self.weights)):
+      f.write(f'<edge id="e{ix}" source="{self.actorIDs[source]}" target="{self.actorIDs[target]}">'
+              f'<data key="weight">{weight:g}</data></edge>\n')
+    f.write('</graph>\n</graphml>\n')
+
+  def _writeGEXF(self, f):
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gexf xmlns="http://www.gexf.net/1.2draft" version="1.2">\n'
+            '<graph mode="static" defaultedgetype="undirected">\n'
+            '<attributes class="node"><attribute id="0" title="actorType" type="string"/></attributes>\n'
+            '<nodes>\n')
+    for actorID, name, actorType in zip(self.actorIDs, self.names, self.actorTypes):
+      f.write(f'<node id="{actorID}" label={quoteattr(str(name))}><attvalues>'
+              f'<attvalue for="0" value={quoteattr(str(actorType or ""))}/></attvalues></node>\n')
+    f.write('</nodes>\n<edges>\n')
+    for ix, (source, target, weight) in enumerate(zip(self.sources, self.targets, self.weights)):
+      f.write(f'<edge id="{ix}" source="{self.actorIDs[source]}" target="{self.actorIDs[target]}" weight="{weight:g}"/>\n')
+    f.write('</edges>\n</graph>\n</gexf>\n')
+
+  def layout(self, seed=0):
+    '''
+    Returns the (x, y) positions of the actors, as a nodeCount x 2 array.
+    Each connected component gets a spectral layout (the leading
+    eigenvectors of its normalized adjacency matrix), which scales with
+    the number of edges, and the components are placed on a grid,
+    largest first. Random if SciPy isn't installed.
+    '''
+    n = self.nodeCount()
+    rng = np.random.default_rng(seed)
+    if coo_matrix is None or n < 4: return rng.random((n, 2))
+
+    adjacency = coo_matrix((np.r_[self.weights, self.weights],
+                            (np.r_[self.sources, self.targets], np.r_[self.targets, self.sources])),
+                           shape=(n, n)).tocsr()
+    count, labels = connected_components(adjacency, directed=False)
+    sizes = np.bincount(labels)
+    components = np.argsort(-sizes, kind='stable')
+    members = np.split(np.argsort(labels, kind='stable'), np.cumsum(sizes)[:-1])
+    columns = int(np.ceil(np.sqrt(count)))
+
+    positions = np.zeros((n, 2))
+    for rank, component in enumerate(components):
+      nodes = members[component]
+      local = SparseGraph._spectralLayout(adjacency[nodes][:, nodes], rng)
+      # centered in a unit cell, scaled with the size of the component
+      span = np.ptp(local, axis=0)
+      local = (local - local.min(axis=0)) / np.where(span > 0, span, 1) - 0.5*(span > 0)
+      local *= 0.9 * np.sqrt(len(nodes)/sizes[components[0]])
+      positions[nodes] = local + [rank % columns, -(rank // columns)]
+    return positions
+
+  @staticmethod
+  def _spectralLayout(adjacency, rng):
+    '''
+    Returns the spectral layout of a connected graph, random if it is too small
+    '''
+    n = adjacency.shape[0]
+    if n < 4: return rng.random((n, 2))
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    scale = diags(1/np.sqrt(np.maximum(degrees, 1e-12)))
+    try:
+      _, vectors = eigsh(scale @ adjacency @ scale, k=3, which='LA', v0=np.ones(n))
+    except Exception as e:
+      logging.error(f'SparseGraph.layout: spectral layout failed, using a random layout: {e}')
+      return rng.random((n, 2))
+    # the leading eigenvector only reflects the degrees
+    return vectors[:, :2][:, ::-1]
+
+  def render(self, path, positions=None, labels=20):
+    '''
+    Renders the graph to an image at path (requires matplotlib), labelling
+    the labels actors of largest weighted degree. Returns False if
+    matplotlib isn't installed.
+    '''
+    try:
+      import matplotlib
+      matplotlib.use('Agg')
+      import matplotlib.pyplot as plt
+      from matplotlib.collections import LineCollection
+    except ImportError:
+      logging.error('SparseGraph.render: matplotlib is not installed')
+      return False
+    if not self.edgeCount():
+      logging.error('SparseGraph.render: the graph has no connections')
+      return False
+
+    positions = self.layout() if positions is None else positions
+    degrees = np.bincount(np.r_[self.sources, self.targets], np.r_[self.weights, self.weights],
+                          minlength=self.nodeCount())
+
+    figure, axes = plt.subplots(figsize=(16, 16))
+    segments = np.stack([positions[self.sources], positions[self.targets]], axis=1)
+    widths = 0.2 + 2*self.weights/self.weights.max() if self.edgeCount() else 0.2
+    axes.add_collection(LineCollection(segments, linewidths=widths, colors='#999999', alpha=0.3))
+    axes.scatter(positions[:, 0], positions[:, 1], s=5 + 200*degrees/max(degrees.max(), 1), zorder=2)
+    for ix in np.argsort(-degrees)[:labels]:
+      axes.annotate(self.names[ix], positions[ix], fontsize=8)
+    axes.set_axis_off()
+    axes.autoscale()
+    figure.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(figure)
+    return True
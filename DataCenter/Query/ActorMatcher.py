@@ -0,0 +1,139 @@
+import re
+import unicodedata
+import numpy as np
+from metaphone import doublemetaphone
+
+try:
+  from rapidfuzz import fuzz, process
+except ImportError:
+  from fuzzywuzzy import fuzz
+  process = None
+
+class ActorMatcher():
+  '''
+  Defines an ActorMatcher, which matches article actor names
+  against a (possibly large) list of watched actor names.
+
+  Watched names are normalized and indexed once by their tokens,
+  the character trigrams of their tokens, and the DoubleMetaphone
+  codes of their tokens. An article name is only scored (token set
+  ratio) against the watched names sharing one of these blocking keys.
+
+  Uses rapidfuzz for batched scoring when installed,
+  fuzzywuzzy otherwise.
+  '''
+
+  def __init__(self, actorNames, threshold=80):
+    '''
+    Initializes the matcher. threshold is the minimum token set ratio
+    (0-100) for a name to match a watched actor.
+    '''
+    self.threshold = threshold
+    self.actorNames = list(actorNames)
+    self._normalized = [ActorMatcher.normalize(name) for name in self.actorNames]
+    self._exact = set(self._normalized)
+
+    # blocking key -> indices of the watched names
+    self._index = {}
+    for ix, name in enumerate(self._normalized):
+      for key in ActorMatcher.blockingKeys(name):
+        self._index.setdefault(key, set()).add(ix)
+
+  @staticmethod
+  def normalize(name):
+    '''
+    Lowercases name, strips its accents and punctuation
+    '''
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', name.lower()).split())
+
+  @staticmethod
+  def blockingKeys(name):
+    '''
+    Returns the blocking keys of a normalized name
+    '''
+    keys = set()
+    for token in name.split():
+      keys.add(('token', token))
+      keys.update(('phonetic', code) for code in doublemetaphone(token) if code)
+      padded = f' {token} '
+      keys.update(('trigram', padded[ix:ix+3]) for ix in range(len(padded)-2))
+    return keys
+
+  def candidates(self, name):
+    '''
+    Returns the indices of the watched names sharing a blocking key with name
+    '''
+    candidates = set()
+    for key in ActorMatcher.blockingKeys(name):
+      candidates |= self._index.get(key, set())
+    return candidates
+
+  def matches(self, actorName):
+    '''
+    Returns True if actorName matches a watched actor
+    '''
+    return bool(self.matchMany([actorName])[0])
+
+  def matchesAny(self, actorNames):
+    '''
+    Returns True if one of actorNames matches a watched actor
+    '''
+    return bool(len(actorNames)) and bool(self.matchMany(actorNames).any())
+
+  def scoreMany(self, actorNames):
+    '''
+    Returns, for each of actorNames, a dictionary of the indices of the
+    watched names it matches (score >= threshold) to their score
+    '''
+    normalized = [ActorMatcher.normalize(name) for name in actorNames]
+    shortlists = {}
+    for ix, name in enumerate(normalized):
+      if not name: continue
+      candidates = self.candidates(name)
+      if candidates: shortlists[ix] = candidates
+    scores = self._score(normalized, shortlists)
+    return [scores.get(ix, {}) for ix in range(len(normalized))]
+
+  def matchMany(self, actorNames):
+    '''
+    Returns a boolean array, True for each of actorNames
+    which matches a watched actor
+    '''
+    normalized = [ActorMatcher.normalize(name) for name in actorNames]
+    matched = np.zeros(len(normalized), dtype=bool)
+
+    # shortlist the names which aren't exact matches
+    shortlists = {}
+    for ix, name in enumerate(normalized):
+      if name in self._exact:
+        matched[ix] = True
+      elif name:
+        candidates = self.candidates(name)
+        if candidates: shortlists[ix] = candidates
+    for ix, rowScores in self._score(normalized, shortlists).items():
+      matched[ix] = bool(rowScores)
+    return matched
+
+  def _score(self, normalized, shortlists):
+    '''
+    Scores each name of shortlists (index -> candidate indices) against
+    its own candidates only. Names with the same shortlist are scored
+    in one batch. Returns, for each index, a dictionary of its candidates
+    scoring >= threshold to their score.
+    '''
+    groups = {}
+    for ix, candidates in shortlists.items():
+      groups.setdefault(tuple(sorted(candidates)), []).append(ix)
+
+    scores = {}
+    for columns, rows in groups.items():
+      if process:
+        matrix = process.cdist([normalized[ix] for ix in rows], [self._normalized[c] for c in columns],
+                               scorer=fuzz.token_set_ratio, score_cutoff=self.threshold)
+      else:
+        matrix = np.array([[fuzz.token_set_ratio(normalized[ix], self._normalized[c]) for c in columns]
+                           for ix in rows])
+      for rx, ix in enumerate(rows):
+        scores[ix] = {columns[jx]: float(matrix[rx, jx]) for jx in np.flatnonzero(matrix[rx] >= self.threshold)}
+    return scores
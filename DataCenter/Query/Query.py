@@ -1,19 +1,31 @@
-from fuzzywuzzy import fuzz
+import json
+import hashlib
 import numpy as np
+import pandas as pd
 import DataCenter.Utils.dbutils as utils
+from DataCenter.Query.ActorMatcher import ActorMatcher
+from DataCenter.Geo.SpatialIndex import SpatialIndex
+from DataCenter.Geo.Geography import Geography
 
 class Query():
   '''
   Defines a Query object. Query objects include a combination
   of Keywords, GKG Themes, Actors, and Locations
 
+  Queries are equal, and hash alike, if their serializations are
+  equal (see key), and can be stored and rebuilt (see storeDB, fromDB).
+
   TODO: Increase modularization of the parameters (i.e. which parameters to query for)
-  TODO: Store Queries in databasing (for use in caching)
   '''
+  _collectionKey = 'query'
 
   def __init__(self, keywords=None, actorNames=None, geographies=None, gkgThemes=None, actorSimilarityThreshold=0.8):
     '''
     Initializes a Query object with the specified parameters.
+
+    actorSimilarityThreshold is the minimum token set similarity
+    for an article actor to match one of actorNames, either as a
+    fraction (0.8) or a percentage (80).
     '''
     self.keywords = keywords
     self.actorNames = utils.formatActors(actorNames)
@@ -21,6 +33,79 @@ class Query():
     self.geographies = geographies
     self.gkgThemes = set(gkgThemes)
 
+    # matcher compiled once for all articles
+    threshold = actorSimilarityThreshold*100 if actorSimilarityThreshold <= 1 else actorSimilarityThreshold
+    # a rounded float, so that 0.9 and 90 serialize alike (0.9*100 is 90.00000000000001)
+    threshold = float(round(threshold, 6))
+    self._threshold = threshold
+    self._actorMatcher = ActorMatcher(self.actorNames, threshold) if self.actorNames else None
+    self._spatialIndex = SpatialIndex(geographies) if geographies else None
+    self._key = None
+
+  def key(self):
+    '''
+    Returns the hex digest identifying the query, a hash of its serialization
+    '''
+    if self._key is None:
+      serialized = json.dumps(self._serialize(), sort_keys=True, default=str)
+      self._key = hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+    return self._key
+
+  def __eq__(self, other):
+    return isinstance(other, Query) and self.key() == other.key()
+
+  def __hash__(self):
+    return hash(self.key())
+
+  def isNarrowerThan(self, other):
+    '''
+    Returns True if every article matching the query also matches other:
+    its themes are among the themes of other, and other watches all actors
+    or a superset of its actors (at a lower or equal threshold), and all
+    geographies or a superset of its geographies. Keywords don't filter.
+    '''
+    if not self.gkgThemes <= other.gkgThemes: return False
+    if other.actorNames:
+      if not self.actorNames or not set(self.actorNames) <= set(other.actorNames): return False
+      if self._threshold < other._threshold: return False
+    if other.geographies:
+      if not self.geographies: return False
+      otherGeographies = {Query._geographyKey(geography) for geography in other.geographies}
+      if any(Query._geographyKey(geography) not in otherGeographies for geography in self.geographies):
+        return False
+    return True
+
+  @staticmethod
+  def _geographyKey(geography):
+    return json.dumps(geography._serialize(), sort_keys=True, default=str)
+
+  def storeDB(self, db):
+    '''
+    Stores the query under its key. Returns the key.
+    '''
+    db[Query._collectionKey].replace_one({'_id': self.key()}, self._serialize(), upsert=True)
+    return self.key()
+
+  def _serialize(self):
+    '''
+    Serializes the query, in a canonical order
+    '''
+    return {
+      'keywords': sorted(self.keywords) if self.keywords else None,
+      'actorNames': sorted(self.actorNames) if self.actorNames else None,
+      'actorSimilarityThreshold': self._threshold,
+      'geographies': [json.loads(key) for key in sorted(map(Query._geographyKey, self.geographies))] if self.geographies else None,
+      'gkgThemes': sorted(self.gkgThemes)
+    }
+
+  @classmethod
+  def fromDB(cls, obj):
+    '''
+    Creates a Query from its MongoDB object
+    '''
+    geographies = [Geography.fromDB(geography) for geography in obj['geographies']] if obj['geographies'] else None
+    return cls(obj['keywords'], obj['actorNames'], geographies, obj['gkgThemes'], obj['actorSimilarityThreshold'])
+
   def filterArticle(self, locations, actorNames, gkgThemes):
     '''
     Returns True if the Article has the specified parameters in the Query,
@@ -34,38 +119,65 @@ class Query():
       return False
     return True
 
+  def locationMask(self, locations):
+    '''
+    Columnar hasLocationInGeographies. Takes a DataFrame of locations
+    (name, latitude, longitude) indexed by row, and returns a boolean
+    Series of the rows with a location in geographies
+    '''
+    if not self.geographies:
+      return pd.Series(True, index=locations.index.unique())
+    inside = self._spatialIndex.includesMany(locations['name'], locations['latitude'], locations['longitude'])
+    return pd.Series(inside, index=locations.index).groupby(level=0).any()
+
+  def actorMask(self, actorNames):
+    '''
+    Columnar hasRelevantActor. Takes a Series of actor names indexed by row,
+    and returns a boolean Series of the rows with a relevant actor
+    '''
+    if not self.actorNames:
+      return pd.Series(True, index=actorNames.index.unique())
+    uniqueNames = actorNames.unique()
+    relevant = dict(zip(uniqueNames, self._actorMatcher.matchMany(uniqueNames)))
+    return actorNames.map(relevant.__getitem__).groupby(level=0).any()
+
+  def themeMask(self, gkgThemes):
+    '''
+    Columnar hasRelevantTheme. Takes a Series of GKG themes indexed by row,
+    and returns a boolean Series of the rows with a relevant theme
+    '''
+    return gkgThemes.isin(self.gkgThemes).groupby(level=0).any()
+
   def hasLocationInGeographies(self, locations):
     '''
     Returns True if locations has a location in geographies
     '''
     if not self.geographies or not locations: return True
-    return bool(np.sum([self.isLocationInGeographies(loc) for loc in locations]))
+    return bool(self._spatialIndex.includesMany(
+      [loc.name for loc in locations],
+      [loc.latitude for loc in locations],
+      [loc.longitude for loc in locations]).any())
 
   def isLocationInGeographies(self, location):
     '''
     Returns True if location is in the geographies
     '''
-    return bool(np.sum([geo.includes(location) for geo in self.geographies]))
+    if not self.geographies: return True
+    return self._spatialIndex.includes(location)
 
   def hasRelevantActor(self, actorNames):
     '''
     Returns True if there is a relevant Actor
     '''
     if not self.actorNames: return True
-    return bool(np.sum([self.isRelevantActor(an) for an in self.actorNames]))
+    return self._actorMatcher.matchesAny(actorNames)
 
   def isRelevantActor(self, actorName):
     '''
-    Returns a set of overlapping relevantActorNames
+    Returns True if actorName matches one of the relevant actorNames
     '''
-    return bool(np.sum([self._findTokenSimilarity(actorName, an) > self.actorSimilarityThreshold for an in self.actorNames]))
-
-  def _findTokenSimilarity(self, string1, string2):
-    '''
-    Finds the similarity between two given strings
-    TODO: Think about optimization with a large amount of relevant actors
-    '''
-    return fuzz.token_set_ratio(string1, string2)
+    if not self.actorNames: return True
+    return self._actorMatcher.matches(actorName)
 
   def hasRelevantTheme(self, gkgThemes):
     '''
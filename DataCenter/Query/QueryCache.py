@@ -0,0 +1,75 @@
+import logging
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from DataCenter.Query.Query import Query
+
+class QueryCache():
+  '''
+  Defines a QueryCache, which persists queries and, for each GKG file
+  (by 14-digit date string) they were run over, the DocumentIdentifiers
+  of the rows they matched.
+
+  A query run again over a file replays its matches, skipping the
+  filters. A narrower query (see Query.isNarrowerThan) only filters
+  the matches of a broader cached query.
+  '''
+  _collectionKey = 'query_match'
+
+  def __init__(self, db):
+    '''
+    Initializes the cache on db, which may be shared by several DataCenters
+    '''
+    self._db = db
+    self._queries = {}
+    try:
+      db[QueryCache._collectionKey].create_index([('queryKey', ASCENDING), ('dateString', ASCENDING)], unique=True)
+    except OperationFailure as e:
+      logging.error(f'QueryCache: query_match has duplicate entries: {e}')
+    # ensure finding the broader queries of a file, fewest matches first
+    db[QueryCache._collectionKey].create_index([('dateString', ASCENDING), ('urlCount', ASCENDING)])
+
+  def record(self, query, dateString, urls):
+    '''
+    Records the DocumentIdentifiers matched by query on the file of dateString.
+    Returns True if acknowledged.
+    '''
+    urls = list(urls)
+    self._queries[query.key()] = query
+    query.storeDB(self._db)
+    result = self._db[QueryCache._collectionKey].replace_one(
+      {'queryKey': query.key(), 'dateString': dateString},
+      {'queryKey': query.key(), 'dateString': dateString, 'urls': urls, 'urlCount': len(urls)},
+      upsert=True)
+    if not result.acknowledged:
+      logging.error('QueryCache.record: record not acknowledged')
+      return False
+    return True
+
+  def lookup(self, query, dateString):
+    '''
+    Returns (urls, exact) for the file of dateString: the matches of query
+    if recorded (exact), else the fewest matches recorded by a query it is
+    narrower than. Returns None if neither was recorded.
+    '''
+    matches = self._db[QueryCache._collectionKey]
+    exact = matches.find_one({'queryKey': query.key(), 'dateString': dateString}, {'urls': 1})
+    if exact: return set(exact['urls']), True
+
+    # only the urls of the chosen query are loaded
+    cursor = matches.find({'dateString': dateString}, {'queryKey': 1}).sort('urlCount', ASCENDING)
+    for doc in cursor:
+      cached = self._query(doc['queryKey'])
+      if cached is None or not query.isNarrowerThan(cached): continue
+      broader = matches.find_one({'_id': doc['_id']}, {'urls': 1})
+      if broader: return set(broader['urls']), False
+    return None
+
+  def _query(self, queryKey):
+    '''
+    Returns the cached query of queryKey, loading it from the database
+    '''
+    if queryKey not in self._queries:
+      obj = self._db[Query._collectionKey].find_one({'_id': queryKey})
+      self._queries[queryKey] = Query.fromDB(obj) if obj else None
+    return self._queries[queryKey]
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from DataCenter.Query.Query import Query
+from DataCenter.Query.ActorMatcher import ActorMatcher
+from DataCenter.Geo.SpatialIndex import SpatialIndex
+
+class QuerySet():
+  '''
+  Defines a QuerySet, which evaluates several Queries together.
+
+  The filters of all the queries are compiled into shared structures:
+  an inverted index of the GKG themes (theme -> queries), a single
+  SpatialIndex over the distinct geographies, and a single ActorMatcher
+  over the distinct actor names (with the lowest threshold, each query
+  then keeping the scores above its own). Each value of a file (theme,
+  location, actor name) is thus evaluated once for all the queries.
+
+  The masks are the columnar masks of Query, with one column per query.
+  '''
+
+  def __init__(self, queries):
+    '''
+    Initializes the QuerySet from a list of Queries
+    '''
+    self.queries = list(queries)
+    count = len(self.queries)
+
+    # theme -> boolean row, True for the queries watching it
+    self._themes = {}
+    for qx, query in enumerate(self.queries):
+      for theme in query.gkgThemes:
+        self._themes.setdefault(theme, np.zeros(count, dtype=bool))[qx] = True
+
+    # distinct geographies, and the queries of each
+    geographies, self._geographyQueries, keys = [], [], {}
+    for qx, query in enumerate(self.queries):
+      for geography in query.geographies or []:
+        key = Query._geographyKey(geography)
+        if key not in keys:
+          keys[key] = len(geographies)
+          geographies.append(geography)
+          self._geographyQueries.append(np.zeros(count, dtype=bool))
+        self._geographyQueries[keys[key]][qx] = True
+    self._geographyQueries = np.array(self._geographyQueries, dtype=bool).reshape(len(geographies), count)
+    self._allLocations = np.array([not query.geographies for query in self.queries], dtype=bool)
+    self._spatialIndex = SpatialIndex(geographies) if geographies else None
+
+    # distinct actor names, and the (query, threshold) watching each
+    actorNames, self._actorQueries, positions = [], [], {}
+    for qx, query in enumerate(self.queries):
+      for name in query.actorNames or []:
+        if name not in positions:
+          positions[name] = len(actorNames)
+          actorNames.append(name)
+          self._actorQueries.append([])
+        self._actorQueries[positions[name]].append((qx, query._threshold))
+    self._allActors = np.array([not query.actorNames for query in self.queries], dtype=bool)
+    threshold = min((query._threshold for query in self.queries if query.actorNames), default=100)
+    self._actorMatcher = ActorMatcher(actorNames, threshold) if actorNames else None
+
+  def __len__(self):
+    return len(self.queries)
+
+  def locationMask(self, locations):
+    '''
+    Takes a DataFrame of locations (name, latitude, longitude) indexed by
+    row, and returns a boolean DataFrame (row x query) of the rows with a
+    location in the geographies of each query
+    '''
+    matrix = np.tile(self._allLocations, (len(locations), 1))
+    if self._spatialIndex and len(locations):
+      inside = self._spatialIndex.includedBy(locations['name'], locations['latitude'], locations['longitude'])
+      matrix |= (inside.astype(np.int32) @ self._geographyQueries.astype(np.int32)) > 0
+    return QuerySet._byRow(matrix, locations.index, len(self))
+
+  def actorMask(self, actorNames):
+    '''
+    Takes a Series of actor names indexed by row, and returns a boolean
+    DataFrame (row x query) of the rows with an actor relevant to each query
+    '''
+    uniqueNames = actorNames.unique()
+    matrix = np.tile(self._allActors, (len(uniqueNames), 1))
+    if self._actorMatcher:
+      for nx, scores in enumerate(self._actorMatcher.scoreMany(uniqueNames)):
+        for watched, score in scores.items():
+          for qx, threshold in self._actorQueries[watched]:
+            if score >= threshold: matrix[nx, qx] = True
+    rows = pd.Index(uniqueNames).get_indexer(actorNames)
+    return QuerySet._byRow(matrix[rows], actorNames.index, len(self))
+
+  def themeMask(self, gkgThemes):
+    '''
+    Takes a Series of GKG themes indexed by row, and returns a boolean
+    DataFrame (row x query) of the rows with a theme watched by each query
+    '''
+    uniqueThemes = gkgThemes.unique()
+    none = np.zeros(len(self), dtype=bool)
+    matrix = np.array([self._themes.get(theme, none) for theme in uniqueThemes], dtype=bool).reshape(-1, len(self))
+    rows = pd.Index(uniqueThemes).get_indexer(gkgThemes)
+    return QuerySet._byRow(matrix[rows], gkgThemes.index, len(self))
+
+  @staticmethod
+  def _byRow(matrix, index, count):
+    '''
+    Groups a (value x query) boolean matrix by the row of each value
+    '''
+    return pd.DataFrame(matrix, index=index, columns=range(count)).groupby(level=0).any()
@@ -0,0 +1,84 @@
+'''
+Benchmarks article enrichment against a local HTTP stand-in for
+the news sites, which serves HTML fixtures with an artificial latency:
+parsing each article before storing it, and the ArticleEnricher.
+
+Usage (from the repository root, with a local MongoDB running):
+  python -m DataCenter.Tests.bench_enrich [articles] [latency in seconds]
+'''
+import sys
+import time
+import random
+from pymongo import MongoClient
+
+from DataCenter.Article.Article import Article
+from DataCenter.Article.ArticleEnricher import ArticleEnricher
+from DataCenter.Tests.bench_fetch import serveFixtures
+
+SENTENCES = [
+  'The government announced new measures to protect the forest from illegal logging.',
+  'Farmers in the region said the drought had destroyed most of the harvest this year.',
+  'Indigenous leaders met with officials to discuss the rights to their ancestral land.',
+  'The minister denied that the agency had ignored warnings about the fires.',
+  'Prices of food staples rose sharply after the floods cut the main roads.',
+  'Human rights groups called for an independent investigation into the killings.',
+  'The company said it would suspend operations until the dispute was resolved.',
+  'Thousands of people marched through the capital to demand action on climate change.',
+]
+
+def makeFixture(paragraphs=12):
+  '''
+  Returns an HTML news page of random English paragraphs
+  '''
+  body = ''.join(f'<p>{" ".join(random.choices(SENTENCES, k=5))}</p>' for _ in range(paragraphs))
+  return (f'<html><head><title>News</title><script>var x = 1;</script></head>'
+          f'<body><h1>{random.choice(SENTENCES)}</h1>{body}</body></html>').encode('utf-8')
+
+def runSerial(urls):
+  '''
+  Parses every article before storing it. Returns the elapsed seconds.
+  '''
+  startTime = time.perf_counter()
+  for url in urls:
+    Article(url, '20190219000000')
+  return time.perf_counter() - startTime
+
+def runEnricher(urls, db, fetchWorkers):
+  '''
+  Stores every article unparsed, then enriches them in the background.
+  Returns (seconds to store, seconds until enriched, articles enriched).
+  '''
+  enricher = ArticleEnricher(db, fetchWorkers, hostLimit=fetchWorkers)
+  startTime = time.perf_counter()
+  for url in urls:
+    article = Article(url, '20190219000000', db=db, parse=False)
+    enricher.submit(article._mongoID, url)
+  stored = time.perf_counter() - startTime
+  enricher.join()
+  elapsed = time.perf_counter() - startTime
+  enriched = enricher.enriched
+  enricher.close()
+  return stored, elapsed, enriched
+
+if __name__ == '__main__':
+  articleCount = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+  latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+
+  fixtures = {f'/news/{ix}.html': makeFixture() for ix in range(articleCount)}
+  server = serveFixtures(fixtures, latency)
+  urls = [f'http://127.0.0.1:{server.server_address[1]}{path}' for path in fixtures]
+
+  client = MongoClient()
+  client.drop_database('bench_enrich')
+  db = client['bench_enrich']
+
+  print(f'Enriching {articleCount} articles ({latency}s latency):')
+  elapsed = runSerial(urls)
+  print(f'* parse before storing: {elapsed:.2f}s ({articleCount/elapsed:.1f} articles/sec)')
+  for fetchWorkers in [4, 16]:
+    stored, elapsed, enriched = runEnricher(urls, db, fetchWorkers)
+    db[Article._collectionKey].drop()
+    print(f'* enricher, {fetchWorkers} fetches: stored in {stored:.2f}s, '
+          f'{enriched} enriched in {elapsed:.2f}s ({articleCount/elapsed:.1f} articles/sec)')
+  client.drop_database('bench_enrich')
+  server.shutdown()
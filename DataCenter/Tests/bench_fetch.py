@@ -0,0 +1,83 @@
+'''
+Benchmarks the GKG fetch stage against a local HTTP stand-in for
+the GDELT server, which serves zip fixtures with an artificial latency.
+
+Usage (from the repository root):
+  python -m DataCenter.Tests.bench_fetch [files] [rows per file] [latency in seconds]
+'''
+import io
+import sys
+import time
+import random
+import string
+import zipfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import DataCenter.Utils.dbutils as utils
+from DataCenter.Utils.fetch import prefetch
+
+def makeFixture(dateString, rows, columns):
+  '''
+  Returns a zipped GKG-shaped TSV file of random rows
+  '''
+  def field():
+    return ';'.join(''.join(random.choices(string.ascii_letters, k=12)) for _ in range(4))
+  text = '\n'.join('\t'.join(field() for _ in range(columns)) for _ in range(rows))
+  buffer = io.BytesIO()
+  with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+    archive.writestr(f'{dateString}.translation.gkg.csv', text)
+  return buffer.getvalue()
+
+def serveFixtures(fixtures, latency):
+  '''
+  Serves fixtures ({path: bytes}) on a local port. Returns the server.
+  '''
+  class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+      time.sleep(latency)
+      body = fixtures.get(self.path)
+      if body is None:
+        self.send_error(404)
+        return
+      self.send_response(200)
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, *args):
+      pass
+
+  server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+def runBenchmark(dateStrings, baseURL, headers, workers):
+  '''
+  Fetches and decodes every file with workers threads (serially if 0),
+  without processing them. Returns the elapsed seconds.
+  '''
+  load = lambda dateString: utils.readDataFrame(utils.getDateURL(dateString, baseURL), headers)
+  startTime = time.perf_counter()
+  for dateString, df in prefetch(dateStrings, load, workers):
+    len(df)
+  return time.perf_counter() - startTime
+
+if __name__ == '__main__':
+  fileCount = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+  rowCount = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+  latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+
+  headers = utils.getSchemaHeaders()
+  dateStrings = utils.getDateRangeStrings('2019 02 19', '2019 02 20')[:fileCount]
+  fixtures = {f'/{dateString}.translation.gkg.csv.zip': makeFixture(dateString, rowCount, len(headers))
+              for dateString in dateStrings}
+  server = serveFixtures(fixtures, latency)
+  baseURL = f'http://127.0.0.1:{server.server_address[1]}'
+
+  print(f'Fetching {fileCount} files of {rowCount} rows ({latency}s latency):')
+  for workers in [0, 2, 4, 8, 16]:
+    elapsed = runBenchmark(dateStrings, baseURL, headers, workers)
+    label = f'{workers} workers' if workers else 'serial'
+    print(f'* {label}: {elapsed:.2f}s ({fileCount/elapsed:.1f} files/sec)')
+  server.shutdown()
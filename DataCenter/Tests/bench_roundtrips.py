@@ -0,0 +1,80 @@
+'''
+Counts the MongoDB round trips needed to ingest one GKG file,
+with direct writes and with the BulkWriter.
+
+The direct run (batchSize None) sends the writes of each row as it is
+processed: its article, actors and location, then its actor graph
+updates (one bulk write per collection, flushed after every article).
+The bulk run gathers the writes of batchSize rows per bulk write.
+Article pages are not fetched, so that only database time is measured.
+
+Usage (from the repository root, with a local MongoDB running):
+  python -m DataCenter.Tests.bench_roundtrips 20190219000000 [path/to/file.gkg.csv.zip]
+'''
+import os
+import sys
+import time
+import pandas as pd
+from pymongo import MongoClient, monitoring
+
+import DataCenter.Utils.dbutils as utils
+from DataCenter.DataCenter import DataCenter
+from DataCenter.Article.Article import Article
+
+class RoundTripCounter(monitoring.CommandListener):
+  '''
+  Counts the commands sent to the server
+  '''
+  def __init__(self):
+    self.count = 0
+
+  def started(self, event):
+    self.count += 1
+
+  def succeeded(self, event):
+    pass
+
+  def failed(self, event):
+    pass
+
+def runBenchmark(dateString, df, batchSize):
+  '''
+  Ingests df in a scratch database, and returns (round trips, seconds, rows stored)
+  '''
+  counter = RoundTripCounter()
+  client = MongoClient(event_listeners=[counter])
+  dbName = f'bench_roundtrips_{batchSize or 0}'
+  client.drop_database(dbName)
+
+  # an empty date range, the file is ingested below
+  date = f'{dateString[:4]} {dateString[4:6]} {dateString[6:8]}'
+  dc = DataCenter(date, date, client=client, dbName=dbName, batchSize=batchSize)
+  dc.getDataFrame = lambda dateString: (True, df.copy())
+
+  counter.count = 0
+  startTime = time.perf_counter()
+  dc.updateDC(dateString)
+  elapsed = time.perf_counter() - startTime
+
+  client.drop_database(dbName)
+  return counter.count, elapsed, dc.relevantDataCount
+
+if __name__ == '__main__':
+  os.makedirs('temp', exist_ok=True)
+  # store the articles unparsed, rather than fetching every page inline
+  Article._parse_url = lambda self, url: False
+  dateString = sys.argv[1]
+  source = sys.argv[2] if len(sys.argv) > 2 else utils.getDateURL(dateString)
+  df = pd.read_csv(source, compression='zip', encoding='latin1', header=None, sep='\t')
+  df.columns = utils.getSchemaHeaders()
+
+  results = {}
+  for batchSize in [None, 1000]:
+    results[batchSize] = runBenchmark(dateString, df, batchSize)
+
+  print('\nRound Trips:')
+  for batchSize, (roundTrips, elapsed, stored) in results.items():
+    label = f'bulk ({batchSize} rows)' if batchSize else 'direct'
+    print(f'* {label}: {roundTrips} round trips, {stored} rows stored, {elapsed:.1f}s')
+  direct, bulk = results[None][0], results[1000][0]
+  print(f'* Reduction: {direct/max(bulk, 1):.1f}x')
@@ -0,0 +1,285 @@
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+import zipfile
+import threading
+import urllib.request
+from urllib.error import HTTPError
+
+import DataCenter.Utils.dbutils as utils
+
+class ArchiveCache():
+  '''
+  Defines a local cache of the raw GKG archives (.translation.gkg.csv.zip),
+  keyed by their 14-digit date string.
+
+  Archives are stored content-addressed (objects/<sha256>.zip) and listed
+  in index.json with their checksum, size, modification time and last
+  access. They are verified when stored, and only hashed again if their
+  size or modification time changed. The cache is bounded by maxBytes,
+  evicting the least recently used archives, but never the ones being
+  returned or read (see open). Last accesses are saved at most every
+  indexInterval seconds (see flush).
+
+  In offline mode, archives are only read from the cache.
+  '''
+  _INDEX = 'index.json'
+
+  def __init__(self, directory='temp/gkg', maxBytes=20*2**30, offline=False,
+               revalidate=False, baseURL=utils.GKG_BASE_URL, timeout=60, indexInterval=30):
+    '''
+    Initializes the cache in directory. If revalidate is True, cached
+    archives are re-requested conditionally (ETag / Last-Modified) and
+    only downloaded again if they changed. Archives are downloaded from
+    baseURL, unless get is given another one.
+    '''
+    self.directory = directory
+    self.maxBytes = maxBytes
+    self.offline = offline
+    self.revalidate = revalidate
+    self.baseURL = baseURL
+    self.timeout = timeout
+    self.indexInterval = indexInterval
+
+    self._lock = threading.Lock()
+    # dateString -> number of get calls returning it
+    self._inUse = {}
+    self._savedAt = time.time()
+    self._dirty = False
+    os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+    self._index = self._loadIndex()
+
+  def get(self, dateString, baseURL=None):
+    '''
+    Returns the path of the cached archive of dateString,
+    downloading it first (from baseURL, if given) if it isn't cached
+    (or failed its integrity check). Safe to call from worker threads.
+    The archive may be evicted once returned, see open to read it.
+    '''
+    entry = self._acquire(dateString)
+    try:
+      return self._get(dateString, entry, baseURL or self.baseURL)
+    finally:
+      self._release(dateString)
+
+  def open(self, dateString, baseURL=None):
+    '''
+    Opens the cached archive of dateString for reading, as get.
+    The archive isn't evicted until the returned file is closed.
+    '''
+    entry = self._acquire(dateString)
+    try:
+      path = self._get(dateString, entry, baseURL or self.baseURL)
+      return io.BufferedReader(_ArchiveFile(path, lambda: self._release(dateString)))
+    except Exception:
+      self._release(dateString)
+      raise
+
+  def _acquire(self, dateString):
+    '''
+    Keeps the archive of dateString from eviction. Returns a copy of its entry.
+    '''
+    with self._lock:
+      self._inUse[dateString] = self._inUse.get(dateString, 0) + 1
+      return dict(self._index.get(dateString) or {})
+
+  def _release(self, dateString):
+    with self._lock:
+      self._inUse[dateString] -= 1
+      if not self._inUse[dateString]: del self._inUse[dateString]
+
+  def _get(self, dateString, entry, baseURL):
+    if entry and not self._verify(entry):
+      logging.error(f'ArchiveCache.get: {dateString} failed integrity check')
+      with self._lock:
+        if dateString in self._index: self._remove(dateString)
+      entry = None
+
+    if entry and (self.offline or not self.revalidate):
+      path = self._touch(dateString)
+      if path: return path
+      # removed by another thread meanwhile
+      entry = None
+    if self.offline:
+      raise FileNotFoundError(f'ArchiveCache.get: {dateString} is not cached (offline)')
+
+    data, headers = self._download(dateString, entry, baseURL)
+    if data is None:
+      # not modified
+      path = self._touch(dateString)
+      if path: return path
+      data, headers = self._download(dateString, None, baseURL)
+    return self._store(dateString, data, headers)
+
+  def flush(self):
+    '''
+    Saves the index, if last accesses changed since it was saved
+    '''
+    with self._lock:
+      if self._dirty: self._saveIndex()
+
+  def contains(self, dateString):
+    '''
+    Returns True if the archive of dateString is cached
+    '''
+    with self._lock:
+      return dateString in self._index
+
+  def size(self):
+    '''
+    Returns the total size of the cached archives, in bytes
+    '''
+    with self._lock:
+      return sum(entry['size'] for entry in self._uniqueObjects().values())
+
+  def _download(self, dateString, entry=None, baseURL=None):
+    '''
+    Downloads the archive. If entry is given, the request is conditional,
+    and (None, None) is returned when the archive did not change.
+    '''
+    request = urllib.request.Request(utils.getDateURL(dateString, baseURL or self.baseURL))
+    if entry and entry.get('etag'):
+      request.add_header('If-None-Match', entry['etag'])
+    if entry and entry.get('lastModified'):
+      request.add_header('If-Modified-Since', entry['lastModified'])
+    try:
+      with urllib.request.urlopen(request, timeout=self.timeout) as response:
+        return response.read(), response.headers
+    except HTTPError as e:
+      if e.code == 304 and entry: return None, None
+      raise
+
+  def _store(self, dateString, data, headers):
+    '''
+    Verifies and stores a downloaded archive. Returns its path.
+    '''
+    digest = hashlib.sha256(data).hexdigest()
+    path = self._objectPath(digest)
+    if not os.path.exists(path):
+      temp = f'{path}.{threading.get_ident()}.tmp'
+      with open(temp, 'wb') as f:
+        f.write(data)
+      if not zipfile.is_zipfile(temp):
+        os.remove(temp)
+        raise ValueError(f'ArchiveCache._store: {dateString} is not a zip archive')
+      os.replace(temp, path)
+
+    with self._lock:
+      self._index[dateString] = {
+        'sha256': digest,
+        'size': len(data),
+        'mtime': os.stat(path).st_mtime_ns,
+        'accessed': time.time(),
+        'etag': headers.get('ETag'),
+        'lastModified': headers.get('Last-Modified')
+      }
+      self._evict()
+      self._saveIndex()
+    return path
+
+  def _touch(self, dateString):
+    '''
+    Marks a cached archive as recently used. Returns its path,
+    or None if it isn't cached anymore.
+    '''
+    with self._lock:
+      entry = self._index.get(dateString)
+      if entry is None: return None
+      entry['accessed'] = time.time()
+      self._dirty = True
+      if entry['accessed'] - self._savedAt >= self.indexInterval: self._saveIndex()
+      return self._objectPath(entry['sha256'])
+
+  def _verify(self, entry):
+    '''
+    Returns True if the stored archive matches its checksum. It is only
+    hashed if it was modified since it was verified.
+    '''
+    path = self._objectPath(entry['sha256'])
+    try:
+      stat = os.stat(path)
+    except FileNotFoundError:
+      return False
+    if stat.st_size != entry['size']: return False
+    if stat.st_mtime_ns == entry.get('mtime'): return True
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+      for block in iter(lambda: f.read(2**20), b''):
+        digest.update(block)
+    if digest.hexdigest() != entry['sha256']: return False
+    with self._lock:
+      for other in self._index.values():
+        if other['sha256'] == entry['sha256']: other['mtime'] = stat.st_mtime_ns
+      self._dirty = True
+    return True
+
+  def _evict(self):
+    '''
+    Removes the least recently used archives until the cache fits maxBytes,
+    keeping the archives being returned by get
+    '''
+    objects = self._uniqueObjects()
+    total = sum(entry['size'] for entry in objects.values())
+    for dateString, entry in sorted(self._index.items(), key=lambda item: item[1]['accessed']):
+      if total <= self.maxBytes: break
+      if dateString in self._inUse: continue
+      if self._remove(dateString): total -= entry['size']
+
+  def _remove(self, dateString):
+    '''
+    Removes an entry, and its archive if no other entry shares it.
+    Returns True if the archive was deleted.
+    '''
+    entry = self._index.pop(dateString)
+    if any(other['sha256'] == entry['sha256'] for other in self._index.values()):
+      return False
+    path = self._objectPath(entry['sha256'])
+    if os.path.exists(path): os.remove(path)
+    return True
+
+  def _uniqueObjects(self):
+    '''
+    Returns the index entries, deduplicated by checksum
+    '''
+    return {entry['sha256']: entry for entry in self._index.values()}
+
+  def _objectPath(self, digest):
+    return os.path.join(self.directory, 'objects', f'{digest}.zip')
+
+  def _loadIndex(self):
+    path = os.path.join(self.directory, ArchiveCache._INDEX)
+    if not os.path.exists(path): return {}
+    try:
+      with open(path) as f:
+        return json.load(f)
+    except ValueError as e:
+      logging.error(f'ArchiveCache._loadIndex: unreadable index, starting empty: {e}')
+      return {}
+
+  def _saveIndex(self):
+    path = os.path.join(self.directory, ArchiveCache._INDEX)
+    with open(f'{path}.tmp', 'w') as f:
+      json.dump(self._index, f)
+    os.replace(f'{path}.tmp', path)
+    self._savedAt = time.time()
+    self._dirty = False
+
+class _ArchiveFile(io.FileIO):
+  '''
+  Cached archive opened for reading, calling onClose once closed
+  '''
+
+  def __init__(self, path, onClose):
+    super().__init__(path, 'rb')
+    self._onClose = onClose
+
+  def close(self):
+    if self.closed: return
+    try:
+      super().close()
+    finally:
+      self._onClose()
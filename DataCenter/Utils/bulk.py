@@ -0,0 +1,165 @@
+import logging
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+class BulkWriter():
+  '''
+  Defines a BulkWriter, which gathers the inserts and updates
+  of an ingestion run and flushes them to MongoDB with
+  insert_many / bulk_write instead of one round trip per operation.
+
+  ObjectIds are generated on the client, so documents can be
+  referenced before they are flushed. An upserted document may turn
+  out to exist already, in which case its queued ObjectId was never
+  stored: those upserts are handed to onExisting after each flush.
+  '''
+
+  def __init__(self, db, batchSize=1000, onExisting=None):
+    '''
+    Initializes a BulkWriter. The writer flushes itself every
+    batchSize rows (see rowDone), or when flush is called.
+    onExisting(collectionKey, upserts) is called with the upserts,
+    as (query, document), which matched an existing document, once
+    every queued operation is written.
+    '''
+    self._db = db
+    self.batchSize = batchSize
+    self.onExisting = onExisting
+    self.roundTrips = 0
+
+    self._rowCount = 0
+    # collectionKey -> list of documents to insert
+    self._inserts = {}
+    # collectionKey -> list of UpdateOne operations
+    self._updates = {}
+    # collectionKey -> list of (query, document) to upsert
+    self._upserts = {}
+    # collectionKey -> (keys, {key: queued documents}), see findPending
+    self._pendingIndexes = {}
+
+  def insert(self, collectionKey, doc):
+    '''
+    Queues a document for insertion, and returns its ObjectId
+    '''
+    if '_id' not in doc: doc['_id'] = ObjectId()
+    self._inserts.setdefault(collectionKey, []).append(doc)
+    if collectionKey in self._pendingIndexes:
+      keys, index = self._pendingIndexes[collectionKey]
+      for key in keys(doc):
+        index.setdefault(key, []).append(doc)
+    return doc['_id']
+
+  def update(self, collectionKey, query, update):
+    '''
+    Queues an update of a single document
+    '''
+    self._updates.setdefault(collectionKey, []).append(UpdateOne(query, update))
+
+  def upsert(self, collectionKey, query, doc):
+    '''
+    Queues the insert of a document, unless a document matching
+    query already exists. Returns the ObjectId of the queued document.
+    '''
+    if '_id' not in doc: doc['_id'] = ObjectId()
+    self._upserts.setdefault(collectionKey, []).append((query, doc))
+    return doc['_id']
+
+  def findPending(self, collectionKey, values, keys):
+    '''
+    Returns the queued (not yet flushed) inserts of the collection
+    with one of values among keys(doc), a list of hashable keys.
+    The queued documents are indexed by keys on the first call
+    (the same keys must be used for every call on a collection).
+    '''
+    if collectionKey not in self._pendingIndexes:
+      index = {}
+      for doc in self._inserts.get(collectionKey, []):
+        for key in keys(doc):
+          index.setdefault(key, []).append(doc)
+      self._pendingIndexes[collectionKey] = (keys, index)
+    index = self._pendingIndexes[collectionKey][1]
+    found = {}
+    for value in values:
+      for doc in index.get(value, []):
+        found[doc['_id']] = doc
+    return list(found.values())
+
+  def rowDone(self):
+    '''
+    Marks a row as processed, flushing once batchSize rows were gathered
+    '''
+    self._rowCount += 1
+    if self.batchSize and self._rowCount >= self.batchSize:
+      return self.flush()
+    return True
+
+  def flush(self):
+    '''
+    Writes all queued operations. Inserts are flushed first, so
+    that updates can reference the new documents.
+    Returns True if every write was acknowledged.
+    '''
+    success = True
+    inserts, self._inserts = self._inserts, {}
+    self._pendingIndexes = {}
+    self._rowCount = 0
+
+    for collectionKey, docs in inserts.items():
+      # documents are independent, so they can be inserted unordered
+      success &= self._write(collectionKey, lambda c: c.insert_many(docs, ordered=False))
+
+    upserts, self._upserts = self._upserts, {}
+    existing = {}
+    for collectionKey, queued in upserts.items():
+      upserted, existing[collectionKey] = self._flushUpserts(collectionKey, queued)
+      success &= upserted
+
+    updates, self._updates = self._updates, {}
+    for collectionKey, operations in updates.items():
+      # several updates may target the same document, so order is kept
+      success &= self._write(collectionKey, lambda c: c.bulk_write(operations, ordered=True))
+
+    if self.onExisting:
+      for collectionKey, queued in existing.items():
+        if queued: self.onExisting(collectionKey, queued)
+    return success
+
+  def _flushUpserts(self, collectionKey, queued):
+    '''
+    Runs the upserts unordered, so a duplicate doesn't abort the others.
+    Returns (success, the upserts which matched an existing document)
+    '''
+    operations = [UpdateOne(query, {'$setOnInsert': doc}, upsert=True) for query, doc in queued]
+    self.roundTrips += 1
+    try:
+      result = self._db[collectionKey].bulk_write(operations, ordered=False)
+      if not result.acknowledged:
+        logging.error(f'BulkWriter: {collectionKey} upserts not acknowledged')
+        return False, []
+      upserted = set(result.upserted_ids.values())
+      failed = False
+    except BulkWriteError as e:
+      upserted = {entry['_id'] for entry in e.details.get('upserted', [])}
+      # duplicate keys are upserts racing another process: the document exists
+      errors = [error for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+      if errors: logging.error(f'BulkWriter: {collectionKey} upserts failed: {errors[:1]}')
+      failed = bool(errors)
+
+    # the queued documents carry their ObjectId, which is the upserted _id
+    return not failed, [(query, doc) for query, doc in queued if doc['_id'] not in upserted]
+
+  def _write(self, collectionKey, operation):
+    '''
+    Runs a bulk operation on the collection. Returns True if acknowledged
+    '''
+    self.roundTrips += 1
+    try:
+      result = operation(self._db[collectionKey])
+    except BulkWriteError as e:
+      logging.error(f'BulkWriter: {collectionKey} bulk write failed: {e.details.get("writeErrors", [])[:1]}')
+      return False
+    if not result.acknowledged:
+      logging.error(f'BulkWriter: {collectionKey} bulk write not acknowledged')
+      return False
+    return True
@@ -1,5 +1,7 @@
-from datetime import datetime, timedelta
-import numpy as np
+import io
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import pandas as pd
 
 def getDateTimeObject(date):
@@ -24,12 +26,10 @@ def getDateStringList(dateObject, interval=15):
   Default corresponds to the 15-minute intervals of a given day
   for access in the GDelt GKG 2.0
   '''
-  # generate numbers
-  timeNums = np.arange(0, 236000, interval*100)
-  # generate dateString
-  dateString = dateObject.strftime("%Y%m%d")
+  # generate the times of the day, every interval minutes
+  times = [dateObject + timedelta(minutes=m) for m in range(0, 24*60, interval)]
   # return as a list of formatted strings
-  return [f'{dateString}{timeNum:06}' for timeNum in timeNums]
+  return [time.strftime('%Y%m%d%H%M%S') for time in times]
 
 def dateRange(startDateObject, endDateObject):
   '''
@@ -52,17 +52,77 @@ def getDateRangeStrings(startDate, endDate):
     output += getDateStringList(date)
   return output
 
-def getDateURL(dateString):
+GKG_BASE_URL = 'http://data.gdeltproject.org/gdeltv2'
+
+def getDateStringsFrom(startDateString, endDateObject, interval=15):
+  '''
+  Creates a list of 14-digit date strings every interval minutes,
+  from startDateString (inclusive) to endDateObject (exclusive)
+  '''
+  date = datetime.strptime(startDateString, '%Y%m%d%H%M%S')
+  output = []
+  while date < endDateObject:
+    output.append(date.strftime('%Y%m%d%H%M%S'))
+    date += timedelta(minutes=interval)
+  return output
+
+def getLatestDateObject(interval=15):
+  '''
+  Returns the start of the current interval (in UTC), which
+  is the date of the latest GDelt GKG file
+  '''
+  # naive, as the date strings are parsed
+  now = datetime.now(timezone.utc).replace(tzinfo=None)
+  return now.replace(minute=now.minute - now.minute % interval, second=0, microsecond=0)
+
+def getDateURL(dateString, baseURL=GKG_BASE_URL):
   '''
   Returns the corresponding GDelt 2.0 GKG URL
   '''
-  return f'http://data.gdeltproject.org/gdeltv2/{dateString}.translation.gkg.csv.zip'
+  return f'{baseURL}/{dateString}.translation.gkg.csv.zip'
+
+def readDataFrame(source, headers):
+  '''
+  Reads a zipped GKG file (url, path or file object) into a dataframe
+  '''
+  df = pd.read_csv(source, compression='zip', encoding='latin1', header=None, sep='\t')
+  df.columns = headers
+  return df
+
+def iterDataFrameChunks(source, headers, columns, chunkSize=10000):
+  '''
+  Reads a zipped GKG file (path or file object) in chunks of chunkSize rows,
+  keeping only columns, all read as strings.
+  Yields one dataframe per chunk. A file object is closed once read.
+  '''
+  try:
+    reader = pd.read_csv(source, compression='zip', encoding='latin1', header=None, sep='\t',
+                         names=headers, usecols=columns, dtype=str, chunksize=chunkSize)
+    with reader:
+      for chunk in reader:
+        yield chunk
+  finally:
+    if hasattr(source, 'close'): source.close()
+
+def downloadArchive(url, timeout=60):
+  '''
+  Downloads a zipped GKG file into memory. Returns a file object.
+  '''
+  with urllib.request.urlopen(url, timeout=timeout) as response:
+    return io.BytesIO(response.read())
 
 def getSchemaHeaders(schema='DataCenter/Utils/schema.csv'):
   '''
   Returns headers for dataframe
   '''
-  return list(pd.read_csv(schema, sep='\t', header=None)[0].values)
+  return list(_readSchemaHeaders(schema))
+
+@lru_cache(maxsize=None)
+def _readSchemaHeaders(schema):
+  '''
+  Reads the schema once per process
+  '''
+  return tuple(pd.read_csv(schema, sep='\t', header=None)[0].values)
 
 def formatActors(relevantActors):
   '''
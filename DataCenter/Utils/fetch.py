@@ -0,0 +1,27 @@
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def prefetch(keys, load, workers=4, depth=None):
+  '''
+  Runs load(key) for every key on a pool of worker threads, keeping
+  up to depth loads in flight ahead of the consumer.
+
+  Yields (key, load(key)) in the order of keys, so the caller
+  can process one result while the next ones are being fetched.
+  If workers is 0 (or less), the loads run serially, in the caller's thread.
+  '''
+  if not workers or workers <= 0:
+    for key in keys:
+      yield key, load(key)
+    return
+
+  depth = depth or 2*workers
+  keys = iter(keys)
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    pending = deque((key, executor.submit(load, key)) for key in itertools.islice(keys, depth))
+    while pending:
+      key, future = pending.popleft()
+      for nextKey in itertools.islice(keys, 1):
+        pending.append((nextKey, executor.submit(load, nextKey)))
+      yield key, future.result()
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from urllib.error import HTTPError
+
+import urllib3
+
+class HTTPClient():
+  '''
+  Defines a pooled HTTP client for article pages, which keeps up to
+  maxConnections alive per host and requests gzip-compressed responses.
+
+  If a cacheDirectory is given, responses are cached on disk (one body
+  and one metadata file per URL) for ttl seconds. Expired responses are
+  revalidated with a conditional request (ETag / Last-Modified), or
+  evicted if they can't be. The cache is bounded by maxBytes, evicting
+  the least recently used responses.
+
+  Safe to use from several threads.
+  '''
+
+  def __init__(self, cacheDirectory=None, maxBytes=2**30, ttl=24*3600,
+               maxConnections=4, timeout=30, userAgent='RiskBoard'):
+    '''
+    Initializes the client and, if cacheDirectory is set, the response cache
+    '''
+    self.cacheDirectory = cacheDirectory
+    self.maxBytes = maxBytes
+    self.ttl = ttl
+    self.timeout = timeout
+    self.hits = 0
+    self.revalidated = 0
+    self.misses = 0
+
+    self._headers = urllib3.make_headers(keep_alive=True, accept_encoding=True, user_agent=userAgent)
+    # retries are left to the callers (see ArticleEnricher), redirects are followed
+    self._pool = urllib3.PoolManager(num_pools=100, maxsize=maxConnections,
+                                     retries=urllib3.Retry(total=None, connect=0, read=0, status=0, other=0, redirect=5))
+
+    self._lock = threading.Lock()
+    # key -> {size, accessed, fetched, revalidatable}
+    self._entries = {}
+    self._size = 0
+    if cacheDirectory:
+      os.makedirs(cacheDirectory, exist_ok=True)
+      self._scan()
+      with self._lock:
+        self._evict(expire=True)
+
+  def get(self, url, timeout=None):
+    '''
+    Returns the body of the response to url, from the cache if it is
+    fresh. Raises urllib.error.HTTPError on error statuses.
+    '''
+    if not self.cacheDirectory:
+      return self._request(url, {}, timeout).data
+
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    meta = self._readMeta(key)
+    if meta and time.time() - meta['fetched'] < self.ttl:
+      body = self._readBody(key)
+      if body is not None:
+        self.hits += 1
+        return body
+
+    headers = {}
+    if meta and meta.get('etag'): headers['If-None-Match'] = meta['etag']
+    if meta and meta.get('lastModified'): headers['If-Modified-Since'] = meta['lastModified']
+    response = self._request(url, headers, timeout, allowNotModified=bool(headers))
+    if response.status == 304:
+      body = self._readBody(key)
+      if body is not None:
+        self.revalidated += 1
+        meta['fetched'] = time.time()
+        self._writeMeta(key, meta)
+        with self._lock:
+          if key in self._entries: self._entries[key]['fetched'] = meta['fetched']
+        return body
+      # the body was evicted meanwhile
+      response = self._request(url, {}, timeout)
+
+    self.misses += 1
+    # only complete pages are cached
+    if response.status == 200 and response.data and 'no-store' not in response.headers.get('Cache-Control', ''):
+      self._store(key, url, response)
+    return response.data
+
+  def stats(self):
+    '''
+    Returns the hit, revalidation and miss counters of the cache
+    '''
+    return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses}
+
+  def clear(self):
+    '''
+    Closes the pooled connections
+    '''
+    self._pool.clear()
+
+  def _request(self, url, headers, timeout=None, allowNotModified=False):
+    '''
+    Sends a GET request on a pooled connection
+    '''
+    response = self._pool.request('GET', url, headers={**self._headers, **headers}, timeout=timeout or self.timeout)
+    if response.status >= 400 or (300 <= response.status < 400 and not (response.status == 304 and allowNotModified)):
+      raise HTTPError(url, response.status, response.reason, response.headers, None)
+    return response
+
+  def _store(self, key, url, response):
+    '''
+    Writes a response to the cache, then evicts
+    '''
+    meta = {
+      'url': url,
+      'fetched': time.time(),
+      'etag': response.headers.get('ETag'),
+      'lastModified': response.headers.get('Last-Modified')
+    }
+    body = self._path(key, 'body')
+    temp = f'{body}.{threading.get_ident()}.tmp'
+    with open(temp, 'wb') as f:
+      f.write(response.data)
+    os.replace(temp, body)
+    self._writeMeta(key, meta)
+    with self._lock:
+      self._remove(key, keepFiles=True)
+      self._size += len(response.data)
+      self._entries[key] = {
+        'size': len(response.data),
+        'accessed': meta['fetched'],
+        'fetched': meta['fetched'],
+        'revalidatable': bool(meta['etag'] or meta['lastModified'])
+      }
+      self._evict()
+
+  def _readBody(self, key):
+    try:
+      with open(self._path(key, 'body'), 'rb') as f:
+        body = f.read()
+    except FileNotFoundError:
+      return None
+    with self._lock:
+      if key in self._entries: self._entries[key]['accessed'] = time.time()
+    return body
+
+  def _readMeta(self, key):
+    try:
+      with open(self._path(key, 'json')) as f:
+        return json.load(f)
+    except (FileNotFoundError, ValueError):
+      return None
+
+  def _writeMeta(self, key, meta):
+    path = self._path(key, 'json')
+    temp = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp, 'w') as f:
+      json.dump(meta, f)
+    os.replace(temp, path)
+
+  def _evict(self, expire=False):
+    '''
+    Once the cache exceeds maxBytes (or if expire is True), removes the
+    expired responses which can't be revalidated, then the least
+    recently used ones until the cache fits maxBytes
+    '''
+    if self._size <= self.maxBytes and not expire: return
+
+    now = time.time()
+    for key, entry in list(self._entries.items()):
+      if now - entry['fetched'] >= self.ttl and not entry['revalidatable']:
+        self._remove(key)
+
+    for key, entry in sorted(self._entries.items(), key=lambda item: item[1]['accessed']):
+      if self._size <= self.maxBytes: break
+      self._remove(key)
+
+  def _remove(self, key, keepFiles=False):
+    entry = self._entries.pop(key, None)
+    if entry: self._size -= entry['size']
+    if keepFiles: return
+    for extension in ('body', 'json'):
+      try:
+        os.remove(self._path(key, extension))
+      except FileNotFoundError:
+        pass
+
+  def _scan(self):
+    '''
+    Lists the cached responses found on disk
+    '''
+    for name in os.listdir(self.cacheDirectory):
+      if not name.endswith('.body'): continue
+      key = name[:-len('.body')]
+      meta = self._readMeta(key)
+      if not meta:
+        self._remove(key)
+        continue
+      stat = os.stat(os.path.join(self.cacheDirectory, name))
+      self._size += stat.st_size
+      self._entries[key] = {
+        'size': stat.st_size,
+        'accessed': stat.st_atime,
+        'fetched': meta['fetched'],
+        'revalidatable': bool(meta.get('etag') or meta.get('lastModified'))
+      }
+
+  def _path(self, key, extension):
+    return os.path.join(self.cacheDirectory, f'{key}.{extension}')
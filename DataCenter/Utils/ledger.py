@@ -0,0 +1,58 @@
+import logging
+from datetime import datetime, timezone
+
+class IngestionLedger():
+  '''
+  Defines the IngestionLedger, which records the GKG files
+  (by 14-digit date string) already ingested in a database,
+  with their row counts and timings.
+
+  A file whose rows failed to be stored is recorded with its failure
+  count, but isn't done: it is ingested again by the next run.
+  '''
+  _collectionKey = 'ingestion_ledger'
+
+  def __init__(self, db):
+    '''
+    Initializes the ledger of the database
+    '''
+    self._collection = db[IngestionLedger._collectionKey]
+
+  def record(self, dateString, totalCount, relevantCount, seconds, failedCount=0):
+    '''
+    Records dateString as ingested, done if no row failed.
+    Returns True if acknowledged.
+    '''
+    result = self._collection.replace_one({'_id': dateString}, {
+      'totalCount': totalCount,
+      'relevantCount': relevantCount,
+      'failedCount': failedCount,
+      'seconds': seconds,
+      'completedAt': datetime.now(timezone.utc)
+    }, upsert=True)
+    if not result.acknowledged:
+      logging.error('IngestionLedger.record: record not acknowledged')
+      return False
+    return True
+
+  def done(self, dateStrings):
+    '''
+    Returns the set of dateStrings already ingested without failures
+    '''
+    cursor = self._collection.find({'_id': {'$in': list(dateStrings)}, 'failedCount': {'$not': {'$gt': 0}}},
+                                   {'_id': 1})
+    return {entry['_id'] for entry in cursor}
+
+  def missing(self, dateStrings):
+    '''
+    Returns the dateStrings not ingested yet, in order
+    '''
+    done = self.done(dateStrings)
+    return [dateString for dateString in dateStrings if dateString not in done]
+
+  def watermark(self):
+    '''
+    Returns the latest ingested dateString, None if nothing was ingested
+    '''
+    latest = self._collection.find_one({'failedCount': {'$not': {'$gt': 0}}}, {'_id': 1}, sort=[('_id', -1)])
+    return latest['_id'] if latest else None
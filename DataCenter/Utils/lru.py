@@ -0,0 +1,88 @@
+from collections import OrderedDict
+
+class LRUCache():
+  '''
+  Defines a size-bounded LRU cache, which keeps
+  hit and miss counters for logging.
+  '''
+
+  def __init__(self, maxSize=100000):
+    '''
+    Initializes an empty LRUCache holding at most maxSize entries
+    '''
+    self.maxSize = maxSize
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+
+  def get(self, key, default=None):
+    '''
+    Returns the cached value of key, and marks it as recently used
+    '''
+    if key not in self._entries:
+      self.misses += 1
+      return default
+    self.hits += 1
+    self._entries.move_to_end(key)
+    return self._entries[key]
+
+  def peek(self, key, default=None):
+    '''
+    Returns the cached value of key without updating the hit and
+    miss counters, and marks it as recently used
+    '''
+    if key not in self._entries: return default
+    self._entries.move_to_end(key)
+    return self._entries[key]
+
+  def put(self, key, value):
+    '''
+    Caches the value of key, evicting the least recently used entry if full
+    '''
+    self._entries[key] = value
+    self._entries.move_to_end(key)
+    if len(self._entries) > self.maxSize:
+      self._entries.popitem(last=False)
+
+  def pop(self, key, default=None):
+    '''
+    Removes key from the cache, and returns its value
+    '''
+    return self._entries.pop(key, default)
+
+  def clear(self):
+    '''
+    Removes every entry
+    '''
+    self._entries.clear()
+
+  def items(self):
+    '''
+    Returns the (key, value) pairs, least recently used first
+    '''
+    return list(self._entries.items())
+
+  def stats(self):
+    '''
+    Returns the hit and miss counters, and the hit rate
+    '''
+    lookups = self.hits + self.misses
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'hitRate': self.hits/lookups if lookups else 0.0,
+      'size': len(self._entries)
+    }
+
+  def resetStats(self):
+    '''
+    Resets the hit and miss counters
+    '''
+    self.hits = 0
+    self.misses = 0
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  def __len__(self):
+    return len(self._entries)
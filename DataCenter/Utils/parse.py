@@ -1,17 +1,44 @@
-import urllib
-from bs4 import BeautifulSoup
+import lxml.html
+
+from DataCenter.Utils.httpclient import HTTPClient
+
+# shared by the fetches which aren't given a client
+_defaultClient = None
+
+def fetchHTML(url, timeout=30, client=None):
+  '''
+  Downloads the page at url, through client (an HTTPClient)
+  or a shared pooled client without cache
+  '''
+  global _defaultClient
+  if client is None:
+    if _defaultClient is None: _defaultClient = HTTPClient()
+    client = _defaultClient
+  return client.get(url, timeout)
+
+def parseDocument(html):
+  '''
+  Parses a page once with lxml, without its script and style
+  elements. The document is shared by extractTextFromDocument
+  and extractParagraphs.
+  '''
+  document = lxml.html.fromstring(html)
+  for element in document.xpath('//script|//style'):
+    element.drop_tree()
+  return document
 
 def extractText(url):
-  with urllib.request.urlopen(url) as url:
-    html = url.read()
-  soup = BeautifulSoup(html, "html.parser")
+  return extractTextFromHTML(fetchHTML(url))
 
-  # kill all script and style elements
-  for script in soup(["script", "style"]):
-      script.extract()    # rip it out
+def extractTextFromHTML(html):
+  return extractTextFromDocument(parseDocument(html))
 
-  # get text
-  text = soup.body.get_text(separator=' ')
+def extractTextFromDocument(document):
+  '''
+  Returns the text of the body of a parsed page, one line per phrase
+  '''
+  body = document.find('body')
+  text = ' '.join((body if body is not None else document).itertext())
 
   # break into lines and remove leading and trailing space on each
   lines = (line.strip() for line in text.splitlines())
@@ -19,4 +46,11 @@ def extractText(url):
   chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
   # drop blank lines
   text = '\n'.join(chunk for chunk in chunks if chunk)
-  return text
\ No newline at end of file
+  return text
+
+def extractParagraphs(document):
+  '''
+  Returns the text of the paragraphs of a parsed page
+  '''
+  paragraphs = (' '.join(' '.join(p.itertext()).split()) for p in document.iter('p'))
+  return [paragraph for paragraph in paragraphs if paragraph]
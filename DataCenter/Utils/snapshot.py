@@ -0,0 +1,97 @@
+import os
+import threading
+import pandas as pd
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pq = None
+
+class FrameSnapshotStore():
+  '''
+  Defines a store of parsed GKG dataframes, one compressed
+  Parquet file per 15-minute date string, holding only the
+  columns used by extraction.
+
+  Requires pyarrow.
+  '''
+
+  def __init__(self, directory='temp/snapshots', columns=None, compression='zstd'):
+    '''
+    Initializes the store in directory. columns are the
+    columns kept in each snapshot (defaults to all of them).
+    '''
+    if pq is None:
+      raise ImportError('FrameSnapshotStore requires pyarrow')
+    self.directory = directory
+    self.columns = columns
+    self.compression = compression
+    os.makedirs(directory, exist_ok=True)
+
+  def contains(self, dateString):
+    '''
+    Returns True if dateString has a snapshot
+    '''
+    return os.path.exists(self._path(dateString))
+
+  def save(self, dateString, df):
+    '''
+    Writes the snapshot of dateString. Returns its path.
+    '''
+    path = self._path(dateString)
+    temp = f'{path}.{threading.get_ident()}.tmp'
+    df = df[self.columns] if self.columns else df
+    df.to_parquet(temp, engine='pyarrow', compression=self.compression, index=False)
+    os.replace(temp, path)
+    return path
+
+  def saveChunks(self, dateString, chunks):
+    '''
+    Writes the snapshot of dateString from an iterator of dataframe
+    chunks (GKG columns read as strings, see dbutils.iterDataFrameChunks),
+    yielding each chunk once it is written. The snapshot only
+    replaces the previous one when every chunk was written.
+    '''
+    path = self._path(dateString)
+    temp = f'{path}.{threading.get_ident()}.tmp'
+    writer = None
+    try:
+      for chunk in chunks:
+        chunk = chunk[self.columns] if self.columns else chunk
+        if not writer:
+          # every column is a string, even if empty in the first chunk
+          schema = pa.schema([(column, pa.string()) for column in chunk.columns])
+          writer = pq.ParquetWriter(temp, schema, compression=self.compression)
+        writer.write_table(pa.Table.from_pandas(chunk, preserve_index=False, schema=writer.schema))
+        yield chunk
+      if writer:
+        writer.close()
+        writer = None
+        os.replace(temp, path)
+    finally:
+      if writer:
+        writer.close()
+        os.remove(temp)
+
+  def iterLoad(self, dateString, columns=None, chunkSize=10000):
+    '''
+    Reads the snapshot of dateString in chunks of chunkSize rows.
+    Yields one dataframe per chunk.
+    '''
+    columns = columns or self.columns
+    snapshot = pq.ParquetFile(self._path(dateString), memory_map=True)
+    for batch in snapshot.iter_batches(batch_size=chunkSize, columns=columns):
+      yield batch.to_pandas()
+
+  def load(self, dateString, columns=None):
+    '''
+    Reads the snapshot of dateString, memory-mapped and
+    projected on columns (defaults to every stored column).
+    '''
+    columns = columns or self.columns
+    return pd.read_parquet(self._path(dateString), engine='pyarrow',
+                           columns=columns, memory_map=True)
+
+  def _path(self, dateString):
+    return os.path.join(self.directory, f'{dateString}.parquet')
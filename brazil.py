@@ -1,9 +1,13 @@
 import pandas as pd
 from geopy.point import Point
+from pymongo import MongoClient
 
 from DataCenter.DataCenter import DataCenter
+from DataCenter.Utils.archive import ArchiveCache
+from DataCenter.Utils.httpclient import HTTPClient
 from DataCenter.Geo.GeoRectangle import GeoRectangle
 from DataCenter.Query.Query import Query
+from DataCenter.Query.QueryCache import QueryCache
 
 if __name__ == '__main__':
   start_date = input('Desired Start Date (YYYY MM DD): ')
@@ -15,6 +19,7 @@ if __name__ == '__main__':
   # get brazilian actors
   # brDf = pd.read_csv('Scenarios/br_cham_legislators.csv')
   # actors = list(brDf.legislator_name)
+  # bounding rectangle of Brazil (see GeoPolygon.fromGeoJSON for the national boundary)
   north = Point.parse_degrees(5, 16, 27.8, 'N')
   south = Point.parse_degrees(33, 45, 4.21, 'S')
   east = Point.parse_degrees(34, 47, 35.33, 'W')
@@ -23,9 +28,16 @@ if __name__ == '__main__':
 
   query = Query(geographies=[brazil], gkgThemes=['ENV_DEFORESTATION', 'ETH_INDIGINOUS', 'ENV_FORESTRY', 'PROPERTY_RIGHTS', 'UNGP_FORESTS_RIVERS_OCEANS', 'AGRICULTURE', 'FOOD_SECURITY', 'SELF_IDENTIFIED_HUMANITARIAN_CRISIS', 'SELF_IDENTIFIED_HUMAN_RIGHTS', 'SELF_IDENTIFIED_ATROCITY', 'SLFID_CIVIL_LIBERTIES', 'TAX_FOODSTAPLES', 'FOOD_STAPLE', 'UNSAFE_WORK_ENVIRONMENT', 'HUMAN_TRAFFICKING'])
 
-  db = DataCenter(start_date, end_date, query=query)
+  # re-runs over the same range read the GKG files and article pages from the local caches,
+  # and replay the rows matched by the query (or a broader one)
+  with DataCenter(start_date, end_date, query=query, archiveCache=ArchiveCache('temp/gkg'),
+                  httpClient=HTTPClient('temp/http'), queryCache=QueryCache(MongoClient()['query_cache'])) as db:
+    print('Visualizing DataCenter...')
+    db.visualizeGraph()
+    print('Finished Visualizing\n')
 
-  print('Visualizing DataCenter...')
-  db.visualizeGraph()
-  print('Finished Visualizing\n')
+    print('Most central actors:')
+    analytics = db.analyzeGraph(start_date, end_date)
+    for actorID, name, score in analytics.top(analytics.pageRank()):
+      print(f'* {name}: {score:.4f}')
 